@@ -0,0 +1,242 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import List
+from langchain_core.embeddings import Embeddings, DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from src.tools.SyncStore import SyncStore, DRAFTED, SENT
+from src.tokens import estimate_tokens
+
+EMAIL_BLOCK_PATTERN = re.compile(r"## \*\*EMAIL ID:\*\* (\S+)\n(.*?)(?=\n\n## \*\*EMAIL ID:\*\*|\Z)", re.DOTALL)
+
+# Keywords used by the fake LLM to "understand" the synthetic emails, checked in this order
+CATEGORY_KEYWORDS = (
+    ("customer_complaint", ("disappointed", "refund", "broken", "complaint")),
+    ("customer_feedback", ("thank", "loved", "great job", "feedback")),
+    ("product_enquiry", ("price", "pricing", "plan", "integrate", "support")),
+)
+
+
+class FakeRateLimitError(Exception):
+    """Injected provider error, retried & failed over by the LLM router like a real 429."""
+    status_code = 429
+
+
+class LatencyInjector:
+    """Sleeps for a random latency and raises injected errors, seeded for reproducible runs."""
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+    def wait(self):
+        delay, failed = self._draw()
+        time.sleep(delay)
+        if failed:
+            raise FakeRateLimitError("Injected rate limit error")
+
+    async def await_(self):
+        delay, failed = self._draw()
+        await asyncio.sleep(delay)
+        if failed:
+            raise FakeRateLimitError("Injected rate limit error")
+
+
+def classify(text):
+    lowered = text.lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return category
+    return "unrelated"
+
+
+def stable_fraction(text):
+    """Deterministic number in [0, 1) derived from the text."""
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16) / 16 ** 8
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model answering the workflow agents from keywords of the synthetic
+    emails, with injected latency & errors. Reports token usage like the real providers.
+    """
+    model_name: str = "fake"
+    reject_rate: float = 0.0
+    injector: LatencyInjector = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def with_structured_output(self, schema, **kwargs):
+        return self.bind(output_schema=schema.__name__) | RunnableLambda(
+            lambda message: schema.model_validate_json(message.content)
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, output_schema=None, **kwargs):
+        if self.injector:
+            self.injector.wait()
+        return self._respond(messages, output_schema)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, output_schema=None, **kwargs):
+        if self.injector:
+            await self.injector.await_()
+        return self._respond(messages, output_schema)
+
+    def _respond(self, messages, output_schema):
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = "\n".join(str(message.content) for message in messages if isinstance(message, HumanMessage))
+        if output_schema is None:
+            content = "Agentia offers flexible plans, 24/7 support and integrations with all major models."
+        else:
+            content = json.dumps(self._structured_answer(output_schema, text))
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": estimate_tokens(prompt),
+            "output_tokens": estimate_tokens(content),
+            "total_tokens": estimate_tokens(prompt) + estimate_tokens(content),
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _structured_answer(self, schema_name, text):
+        if schema_name == "CategorizeEmailOutput":
+            return {"category": classify(text)}
+        if schema_name == "RAGQueriesOutput":
+            return {"queries": self._queries(text)}
+        if schema_name == "TriageEmailOutput":
+            category = classify(text)
+            return {"category": category, "queries": self._queries(text) if category == "product_enquiry" else []}
+        if schema_name == "BatchCategorizeEmailOutput":
+            return {"items": [
+                {"email_id": email_id, "category": classify(body)}
+                for email_id, body in EMAIL_BLOCK_PATTERN.findall(text)
+            ]}
+        if schema_name == "BatchRAGQueriesOutput":
+            return {"items": [
+                {"email_id": email_id, "queries": self._queries(body)}
+                for email_id, body in EMAIL_BLOCK_PATTERN.findall(text)
+            ]}
+        if schema_name == "WriterOutput":
+            draft_number = text.count("**Draft") + 1
+            return {"email": f"Dear customer,\n\nThank you for reaching out (draft {draft_number}). "
+                             "Our team reviewed your message and here is our answer.\n\nBest regards,\nAgentia"}
+        if schema_name == "ProofReaderOutput":
+            send = stable_fraction(text) >= self.reject_rate
+            return {"feedback": "Looks good." if send else "Make the answer more specific.", "send": send}
+        raise ValueError(f"Unsupported output schema: {schema_name}")
+
+    @staticmethod
+    def _queries(text):
+        queries = ["What are the pricing plans?"]
+        if "integrate" in text.lower():
+            queries.append("Which models and tools can be integrated?")
+        if "support" in text.lower():
+            queries.append("What support is included?")
+        return queries
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings with injected latency."""
+    def __init__(self, size=256, injector: LatencyInjector = None):
+        self.embeddings = DeterministicFakeEmbedding(size=size)
+        self.injector = injector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.injector:
+            self.injector.wait()
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.injector:
+            self.injector.wait()
+        return self.embeddings.embed_query(text)
+
+
+class FakeGmailTools:
+    """In-memory stand-in of GmailToolsClass serving a synthetic inbox and its threads."""
+    def __init__(self, emails, injector: LatencyInjector = None, page_size=50, threads=None):
+        self.inbox = list(emails)
+        self.threads = threads or {}
+        self.injector = injector
+        self.page_size = page_size
+        self.incremental_sync = False
+        self.sync_store = SyncStore(":memory:")
+        self.drafts = []
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def _call(self):
+        if self.injector:
+            self.injector.wait()
+
+    def fetch_unanswered_emails(self, max_results=None, skip_ids=()):
+        # list + batched get, like the real client
+        self._call()
+        self._call()
+        limit = max_results or self.page_size
+        with self._lock:
+            emails = [email for email in self.inbox[:limit] if email["id"] not in skip_ids]
+            self.inbox = self.inbox[limit:]
+        for email in emails:
+            self.sync_store.mark_seen(email["threadId"], email["id"])
+        return emails
+
+    def create_draft_reply(self, initial_email, reply_text):
+        self._call()
+        with self._lock:
+            self.drafts.append((initial_email.id, reply_text))
+        self.sync_store.update_thread(initial_email.threadId, initial_email.id, DRAFTED)
+        return {"id": f"draft-{initial_email.id}"}
+
+    def send_reply(self, initial_email, reply_text):
+        self._call()
+        with self._lock:
+            self.sent.append((initial_email.id, reply_text))
+        self.sync_store.update_thread(initial_email.threadId, initial_email.id, SENT)
+        return {"id": f"sent-{initial_email.id}"}
+
+    def write_replies(self, replies):
+        # one batch request
+        self._call()
+        results = {}
+        for key, initial_email, reply_text, send in replies:
+            with self._lock:
+                (self.sent if send else self.drafts).append((initial_email.id, reply_text))
+            results[key] = ({"id": f"{'sent' if send else 'draft'}-{initial_email.id}"}, None)
+        return results
+
+    def fetch_thread(self, thread_id, known_ids=()):
+        # threads.get
+        self._call()
+        return [
+            dict(message, body=None if message["id"] in known_ids else message["body"])
+            for message in self.threads.get(thread_id, [])
+        ]
+
+    def find_reply(self, thread_id, idempotency_key):
+        self._call()
+        return None
+
+    def watch_inbox(self, topic_name):
+        return {"historyId": "1", "expiration": None}
@@ -0,0 +1,134 @@
+import random
+
+# Default share of each kind of email in the synthetic inbox
+DEFAULT_CATEGORY_MIX = {
+    "product_enquiry": 0.4,
+    "customer_complaint": 0.15,
+    "customer_feedback": 0.15,
+    "unrelated": 0.2,
+    "newsletter": 0.1,
+}
+# Number of filler paragraphs of each email size
+EMAIL_SIZES = {"short": 0, "medium": 3, "long": 12}
+DEFAULT_SIZE_MIX = {"short": 0.5, "medium": 0.35, "long": 0.15}
+# Default share of the emails answering an earlier thread, and maximum number of earlier messages
+DEFAULT_REPLY_SHARE = 0.3
+MAX_EARLIER_MESSAGES = 8
+# Earlier messages are longer on average, so long threads get summarized
+DEFAULT_THREAD_SIZE_MIX = {"short": 0.3, "medium": 0.4, "long": 0.3}
+SUPPORT_SENDER = "support@agentia.example.com"
+
+OPENINGS = {
+    "product_enquiry": [
+        "Could you tell me more about your pricing and which plan fits a small agency?",
+        "Can I integrate my own models with your platform, and what does the pro plan cost?",
+        "What kind of support do you offer on the enterprise plan?",
+    ],
+    "customer_complaint": [
+        "I am disappointed with the service, my agent has been broken for two days.",
+        "This is a complaint about the billing, I would like a refund for last month.",
+    ],
+    "customer_feedback": [
+        "Just wanted to say thank you, the new dashboard is fantastic.",
+        "We loved the onboarding session, here is some feedback from our team.",
+    ],
+    "unrelated": [
+        "Are you free for lunch on Friday?",
+        "Reminder: the office will be closed next Monday.",
+    ],
+    "newsletter": [
+        "This week in AI: the ten tools everyone is talking about.",
+        "Your monthly digest of industry news is here.",
+    ],
+}
+FILLER = (
+    "We are a team of twelve people working with clients across Europe and we have been "
+    "looking at several options over the last weeks, comparing features, reliability and "
+    "the quality of the documentation before taking a decision."
+)
+
+
+def _pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _body(paragraphs):
+    return "Hello,\n\n" + "\n\n".join(paragraphs) + "\n\nBest,\nAlex"
+
+
+def generate_inbox(count, category_mix=None, size_mix=None, reply_share=DEFAULT_REPLY_SHARE, seed=0):
+    """
+    Generates synthetic inbox emails, in the format returned by GmailToolsClass.fetch_unanswered_emails.
+
+    @param count: Number of emails
+    @param category_mix: Share of each kind of email (categories + "newsletter" for bulk emails)
+    @param size_mix: Share of each email size ("short", "medium", "long")
+    @param reply_share: Share of the emails answering earlier messages of their thread (see generate_threads)
+    @param seed: Random seed, the same seed always generates the same inbox
+    @return: List of email dictionaries
+    """
+    rng = random.Random(seed)
+    # Separate generator: the replies don't change the emails generated for a seed
+    reply_rng = random.Random(f"{seed}-replies")
+    category_mix = category_mix or DEFAULT_CATEGORY_MIX
+    size_mix = size_mix or DEFAULT_SIZE_MIX
+    emails = []
+    for i in range(count):
+        kind = _pick(rng, category_mix)
+        size = _pick(rng, size_mix)
+        paragraphs = [rng.choice(OPENINGS[kind])] + [FILLER] * EMAIL_SIZES[size]
+        headers = {}
+        sender = f"customer{i}@example.com"
+        if kind == "newsletter":
+            # Detected by the local pre-classifier, never reaches the LLM
+            headers = {"list-unsubscribe": "<mailto:unsubscribe@news.example.com>"}
+            sender = "newsletter@news.example.com"
+        references = ""
+        if kind != "newsletter" and reply_rng.random() < reply_share:
+            earlier = reply_rng.randint(1, MAX_EARLIER_MESSAGES)
+            references = " ".join(f"<msg-{i}-{n}@example.com>" for n in range(earlier))
+        emails.append({
+            "id": f"msg-{i}",
+            "threadId": f"thread-{i}",
+            "messageId": f"<msg-{i}@example.com>",
+            "references": references,
+            "sender": sender,
+            "subject": paragraphs[0][:40],
+            "body": _body(paragraphs),
+            "headers": headers,
+        })
+    return emails
+
+
+def generate_threads(emails, size_mix=None, seed=0):
+    """
+    Generates the earlier messages of the inbox emails answering a thread (one per reference),
+    in the format returned by GmailToolsClass.fetch_thread. Some threads also hold an unsent draft.
+
+    @param emails: Inbox emails returned by generate_inbox
+    @param size_mix: Share of each size of the earlier messages
+    @param seed: Random seed
+    @return: Dictionary mapping each thread id to its messages, oldest first
+    """
+    rng = random.Random(seed)
+    size_mix = size_mix or DEFAULT_THREAD_SIZE_MIX
+    threads = {}
+    for email in emails:
+        messages = []
+        for n, reference in enumerate(email["references"].split()):
+            customer = n % 2 == 0
+            opening = rng.choice(OPENINGS["product_enquiry"]) if customer else "Thanks for your message."
+            messages.append({
+                "id": reference.strip("<>").split("@")[0],
+                "sender": email["sender"] if customer else SUPPORT_SENDER,
+                "labels": ["INBOX"] if customer else ["SENT"],
+                "body": _body([opening] + [FILLER] * EMAIL_SIZES[_pick(rng, size_mix)]),
+            })
+        if messages and rng.random() < 0.25:
+            messages.append({
+                "id": f"{email['id']}-draft", "sender": SUPPORT_SENDER, "labels": ["DRAFT"],
+                "body": _body(["Unsent draft, never part of the conversation."]),
+            })
+        messages.append({"id": email["id"], "sender": email["sender"], "labels": ["INBOX"], "body": email["body"]})
+        threads[email["threadId"]] = messages
+    return threads
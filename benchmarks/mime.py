@@ -0,0 +1,215 @@
+import time
+import base64
+import random
+import argparse
+from pathlib import Path
+from email import policy
+from email.parser import BytesParser
+from email.message import EmailMessage
+from src.tokens import estimate_tokens
+from src.tools.BodyExtractor import BodyExtractor, HTML_PARSER_MODULES
+
+SENTENCES = [
+    "Thanks for getting back to me so quickly about the renewal of our subscription.",
+    "We would like to add three more seats for the support team before the end of the month.",
+    "Could you confirm whether the enterprise plan includes the custom model integrations?",
+    "Our finance department needs an updated invoice with the new billing address.",
+    "The dashboard has been very slow since the last update, especially the reports page.",
+    "Let me know if a call on Thursday afternoon works for you and your colleague.",
+]
+STYLE = "<style>" + "".join(f".c{i} {{ color: #{i:06x}; padding: {i}px; }}" for i in range(80)) + "</style>"
+
+
+def paragraphs(rng, count):
+    return [" ".join(rng.choice(SENTENCES) for _ in range(3)) for _ in range(count)]
+
+
+def newsletter(rng):
+    """Marketing HTML: inline styles, layout tables, tracking pixels & a long footer."""
+    rows = "".join(
+        f'<tr><td class="c{i}" style="padding:12px;font-family:Arial"><table><tr><td>'
+        f'<a href="https://example.com/track?id={i}"><img src="https://example.com/p{i}.png" width="600"></a>'
+        f'<p style="font-size:14px">{text}</p></td></tr></table></td></tr>'
+        for i, text in enumerate(paragraphs(rng, 60))
+    )
+    html = (
+        f"<html><head>{STYLE}<script>window.dataLayer=[];</script></head><body>"
+        f'<table width="100%">{rows}</table><img src="https://example.com/open.gif" width="1" height="1">'
+        f'<p style="font-size:10px">{" ".join(paragraphs(rng, 6))} Unsubscribe | Preferences</p></body></html>'
+    )
+    message = EmailMessage()
+    message.set_content(html, subtype="html")
+    return message
+
+
+def outlook_html(rng):
+    """Outlook HTML: a large <head> of styles & conditional comments before a short message."""
+    styles = "".join(
+        f"<style>p.MsoNormal{i}, li.MsoNormal{i} {{ margin: 0cm; font-size: 11.0pt; font-family: Calibri; }}</style>"
+        f"<!--[if gte mso 9]><xml><o:shapedefaults v:ext=\"edit\" spidmax=\"{i}\" /></xml><![endif]-->"
+        for i in range(800)
+    )
+    html = (
+        f'<html><head><meta charset="utf-8">{styles}</head><body lang="EN-US">'
+        f'<div class="WordSection1"><p class="MsoNormal">{paragraphs(rng, 1)[0]}</p></div></body></html>'
+    )
+    message = EmailMessage()
+    message.set_content(html, subtype="html")
+    return message
+
+
+def gmail_reply(rng):
+    """Gmail HTML reply quoting the previous messages of the thread."""
+    quote = "".join(f"<p>{text}</p>" for text in paragraphs(rng, 8))
+    for _ in range(3):
+        quote = (
+            '<div class="gmail_quote"><div class="gmail_attr">On Mon, Jan 6, 2025 at 9:14 AM '
+            f"Jane Doe &lt;jane@example.com&gt; wrote:<br></div><blockquote>{quote}</blockquote></div>"
+        )
+    html = f'<div dir="ltr"><p>{paragraphs(rng, 1)[0]}</p></div><br>{quote}'
+    message = EmailMessage()
+    message.add_alternative(html, subtype="html")
+    return message
+
+
+def outlook_reply(rng):
+    """Outlook plain text reply with a From/Sent header block above the previous message."""
+    previous = "\n\n".join(paragraphs(rng, 10))
+    text = (
+        f"{paragraphs(rng, 1)[0]}\n\nBest regards,\nJohn\n\n"
+        "________________________________\nFrom: Jane Doe <jane@example.com>\n"
+        "Sent: Monday, January 6, 2025 9:14 AM\nTo: John Smith <john@example.com>\n"
+        f"Subject: RE: Renewal\n\n{previous}"
+    )
+    message = EmailMessage()
+    message.set_content(text)
+    return message
+
+
+def quoted_plain(rng):
+    """Plain text reply with "> " quoted lines and a "-- " signature."""
+    quoted = "\n".join(f"> {line}" for line in paragraphs(rng, 12))
+    text = (
+        f"{paragraphs(rng, 2)[0]}\n\n-- \nJohn Smith\nHead of Support, Example Inc.\n+1 555 0100\n\n"
+        f"On Mon, Jan 6, 2025 at 9:14 AM Jane Doe <jane@example.com> wrote:\n{quoted}"
+    )
+    message = EmailMessage()
+    message.set_content(text)
+    return message
+
+
+def alternative(rng):
+    """Short multipart/alternative email with an attachment."""
+    text = "\n\n".join(paragraphs(rng, 2))
+    message = EmailMessage()
+    message.set_content(text)
+    message.add_alternative("".join(f"<p>{line}</p>" for line in text.split("\n\n")), subtype="html")
+    message.add_attachment(bytes(rng.getrandbits(8) for _ in range(20000)), maintype="application",
+                           subtype="pdf", filename="invoice.pdf")
+    return message
+
+
+SAMPLES = {
+    "newsletter": newsletter,
+    "outlook_html": outlook_html,
+    "gmail_reply": gmail_reply,
+    "outlook_reply": outlook_reply,
+    "quoted_plain": quoted_plain,
+    "alternative": alternative,
+}
+
+
+def to_gmail_payload(message):
+    """Converts a MIME message to the "payload" of a Gmail message fetched with format="full"."""
+    part = {
+        "mimeType": message.get_content_type(),
+        "headers": [{"name": name, "value": str(value)} for name, value in message.items()],
+        "body": {},
+    }
+    if message.is_multipart():
+        part["parts"] = [to_gmail_payload(child) for child in message.iter_parts()]
+    else:
+        data = message.get_payload(decode=True) or b""
+        part["body"] = {"size": len(data), "data": base64.urlsafe_b64encode(data).decode()}
+    return part
+
+
+def load_corpus(eml_dir, seed):
+    """Synthetic samples of every kind, plus the .eml files of eml_dir when given."""
+    rng = random.Random(seed)
+    corpus = [(name, to_gmail_payload(build(rng))) for name, build in SAMPLES.items()]
+    if eml_dir:
+        for path in sorted(Path(eml_dir).glob("*.eml")):
+            with open(path, "rb") as file:
+                message = BytesParser(policy=policy.default).parse(file)
+            corpus.append((path.name, to_gmail_payload(message)))
+    return corpus
+
+
+def measure(extractor, corpus, repeats):
+    """Mean & p95 extraction time (ms) and output tokens of each sample."""
+    results = {}
+    for name, payload in corpus:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            text = extractor.extract(payload)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[name] = {
+            "mean_ms": round(1000 * sum(timings) / len(timings), 3),
+            "p95_ms": round(1000 * timings[min(len(timings) - 1, int(0.95 * len(timings)))], 3),
+            "tokens": estimate_tokens(text),
+        }
+    return results
+
+
+def installed_parsers():
+    parsers = []
+    for name, module in HTML_PARSER_MODULES.items():
+        try:
+            __import__(module)
+            parsers.append(name)
+        except ImportError:
+            continue
+    return parsers
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark of the email body extraction: parse time & output tokens per MIME sample, "
+                    "compared with the previous extraction (whole body decoded, BeautifulSoup, quotes kept)."
+    )
+    parser.add_argument("--eml-dir", help="Folder of real .eml files added to the synthetic samples")
+    parser.add_argument("--repeats", type=int, default=50, help="Extractions of each sample")
+    parser.add_argument("--max-chars", type=int, default=8000, help="Body size cap of the extractor")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.eml_dir, args.seed)
+    baseline = measure(BodyExtractor(max_chars=None, html_parser="html.parser", strip_quotes=False), corpus, args.repeats)
+    print(f"{len(corpus)} samples, {args.repeats} extractions each, cap of {args.max_chars} characters")
+
+    for html_parser in installed_parsers():
+        results = measure(BodyExtractor(args.max_chars, html_parser, strip_quotes=True), corpus, args.repeats)
+        print(f"\n{html_parser}")
+        print(f"{'sample':<20}{'before ms':>11}{'after ms':>10}{'p95 ms':>9}{'before tok':>12}{'after tok':>11}{'saved':>8}")
+        for name, _ in corpus:
+            before, after = baseline[name], results[name]
+            saved = 1 - after["tokens"] / before["tokens"]
+            print(
+                f"{name[:19]:<20}{before['mean_ms']:>11}{after['mean_ms']:>10}{after['p95_ms']:>9}"
+                f"{before['tokens']:>12}{after['tokens']:>11}{saved:>8.0%}"
+            )
+        total_before = sum(result["tokens"] for result in baseline.values())
+        total_after = sum(result["tokens"] for result in results.values())
+        time_before = sum(result["mean_ms"] for result in baseline.values())
+        time_after = sum(result["mean_ms"] for result in results.values())
+        print(
+            f"{'total':<20}{time_before:>11.3f}{time_after:>10.3f}{'':>9}"
+            f"{total_before:>12}{total_after:>11}{1 - total_after / total_before:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
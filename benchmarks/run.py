@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_chroma import Chroma
+from create_index import load_documents, chunk_documents, sync_index
+from src.config import WorkflowConfig
+from src.log import setup_logging
+from src.agents import Agents
+from src.nodes import Nodes
+from src.graph import Workflow
+from src.llm_router import LLMRouter
+from .fakes import FakeChatModel, FakeEmbeddings, FakeGmailTools, LatencyInjector
+from .inbox import generate_inbox, generate_threads
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Records the wall time of every graph node run (inbox graph & email subgraph)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._graph_runs = set()
+        self._starts = {}
+        self.latencies = defaultdict(list)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name")
+        with self._lock:
+            if name == "LangGraph":
+                self._graph_runs.add(run_id)
+            elif parent_run_id in self._graph_runs and name == (metadata or {}).get("langgraph_node"):
+                self._starts[run_id] = (name, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._record(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._record(run_id)
+
+    def _record(self, run_id):
+        with self._lock:
+            start = self._starts.pop(run_id, None)
+            if start is not None:
+                name, started_at = start
+                self.latencies[name].append(time.perf_counter() - started_at)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def build_workflow(args, inbox, persist_dir, checkpoint_path):
+    """Builds the real Workflow on top of the fake Gmail, LLMs & embeddings."""
+    config = WorkflowConfig.from_env().model_copy(update={
+        "max_concurrency": args.max_concurrency,
+        "vectorstore_dir": persist_dir,
+        "checkpoint_db_path": checkpoint_path,
+        "embedding_cache_path": "",
+    })
+
+    embeddings = FakeEmbeddings(injector=LatencyInjector(args.embedding_latency, seed=args.seed))
+    vectorstore = Chroma(persist_directory=persist_dir, embedding_function=FakeEmbeddings())
+    sync_index(vectorstore, chunk_documents(load_documents(args.data_dir), 300, 50), 64)
+
+    llm_injector = LatencyInjector(args.llm_latency, args.llm_jitter, args.llm_error_rate, seed=args.seed)
+    router = LLMRouter(
+        [
+            (name, name, FakeChatModel(model_name=name, reject_rate=args.reject_rate, injector=llm_injector))
+            for name in ("fake-a", "fake-b")
+        ],
+        requests_per_second=args.llm_rps,
+        base_delay=0.01
+    )
+    gmail_tools = FakeGmailTools(
+        inbox, injector=LatencyInjector(args.gmail_latency, seed=args.seed), page_size=len(inbox),
+        threads=generate_threads(inbox, seed=args.seed)
+    )
+    agents = Agents(config, router=router, embeddings=embeddings)
+    workflow = Workflow(config, nodes=Nodes(config, agents=agents, gmail_tools=gmail_tools))
+    return workflow, llm_injector, gmail_tools
+
+
+async def run_benchmark(args):
+    inbox = generate_inbox(args.emails, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workflow, llm_injector, gmail_tools = build_workflow(
+            args, inbox, os.path.join(tmp_dir, "db"), os.path.join(tmp_dir, "checkpoints.db")
+        )
+        timer = NodeTimer()
+        start = time.perf_counter()
+        await workflow.app.ainvoke({"emails": []}, {"recursion_limit": 100, "callbacks": [timer]})
+        elapsed = time.perf_counter() - start
+
+        usage = workflow.nodes.agents.token_usage.summary()
+        llm_calls = sum(agent["calls"] for agent in usage.values())
+        prompt_tokens = sum(agent["prompt_tokens"] for agent in usage.values())
+        return {
+            "emails": args.emails,
+            "elapsed_seconds": round(elapsed, 3),
+            "emails_per_second": round(args.emails / elapsed, 2),
+            "drafts": len(gmail_tools.drafts),
+            "llm_calls_per_email": round(llm_calls / args.emails, 2),
+            "prompt_tokens_per_email": round(prompt_tokens / args.emails),
+            "llm_injected_errors": llm_injector.errors,
+            "gmail_calls": gmail_tools.injector.calls,
+            "llm_calls_per_agent": {agent: stats["calls"] for agent, stats in usage.items()},
+            "nodes": {
+                node: {
+                    "runs": len(latencies),
+                    "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+                    "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                }
+                for node, latencies in sorted(timer.latencies.items())
+            },
+        }
+
+
+def print_report(report):
+    print(f"\n{report['emails']} emails in {report['elapsed_seconds']}s: {report['emails_per_second']} emails/sec")
+    print(f"Drafts created: {report['drafts']}, Gmail calls: {report['gmail_calls']}")
+    print(
+        f"LLM calls per email: {report['llm_calls_per_email']} "
+        f"(~{report['prompt_tokens_per_email']} prompt tokens per email, "
+        f"{report['llm_injected_errors']} injected errors)"
+    )
+    print(f"\n{'node':<24}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}")
+    for node, stats in report["nodes"].items():
+        print(f"{node:<24}{stats['runs']:>6}{stats['p50_ms']:>10}{stats['p95_ms']:>10}")
+    print(f"\n{'agent':<28}{'LLM calls':>10}")
+    for agent, calls in sorted(report["llm_calls_per_agent"].items()):
+        print(f"{agent:<28}{calls:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end benchmark of the workflow (fake Gmail, LLMs & embeddings, no network). "
+                    "Workflow settings are read from the environment like the real app."
+    )
+    parser.add_argument("--emails", type=int, default=100, help="Number of synthetic inbox emails")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mean LLM call latency (seconds)")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="Random variation of the LLM latency (seconds)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of LLM calls failing with a 429")
+    parser.add_argument("--llm-rps", type=float, default=1000.0, help="Rate limit of each fake LLM provider")
+    parser.add_argument("--reject-rate", type=float, default=0.2, help="Share of drafts rejected by the proofreader")
+    parser.add_argument("--gmail-latency", type=float, default=0.05, help="Gmail API call latency (seconds)")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Embedding call latency (seconds)")
+    parser.add_argument("--data-dir", default="./data", help="Knowledge base indexed with fake embeddings")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show the workflow logs")
+    args = parser.parse_args()
+    setup_logging("INFO" if args.verbose else "ERROR")
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
+import time
+import hashlib
+import argparse
+from pathlib import Path
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_chroma import Chroma
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
+from src.config import WorkflowConfig
+from src.embeddings import get_embeddings
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -22,35 +28,109 @@ Question: {question}
 Context: {context}
 """
 
-print("Loading & Chunking Docs...")
-loader = TextLoader("./data/agency.txt")
-docs = loader.load()
+DOCUMENT_EXTENSIONS = (".txt", ".md")
 
-doc_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50)
-doc_chunks = doc_splitter.split_documents(docs)
 
-print("Creating vector embeddings...")
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+def load_documents(data_dir):
+    """Loads every text document of the data directory (recursively)."""
+    docs = []
+    for path in sorted(Path(data_dir).rglob("*")):
+        if path.is_file() and path.suffix in DOCUMENT_EXTENSIONS:
+            docs.extend(TextLoader(str(path), encoding="utf-8").load())
+    return docs
 
-vectorstore = Chroma.from_documents(doc_chunks, embeddings, persist_directory="db")
 
-# Semantic vector search
-vectorstore_retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+def chunk_documents(docs, chunk_size, chunk_overlap):
+    """
+    Splits documents into chunks identified by the hash of their source and content,
+    so unchanged chunks keep the same id between runs.
 
-# Test RAG chain
-print("Test RAG chain...")
-prompt = ChatPromptTemplate.from_template(RAG_SEARCH_PROMPT_TEMPLATE)
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.1)
+    @return: Dictionary mapping each chunk id to its chunk
+    """
+    doc_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = {}
+    for chunk in doc_splitter.split_documents(docs):
+        key = f"{chunk.metadata.get('source', '')}\n{chunk.page_content}"
+        chunk_id = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        chunks[chunk_id] = chunk
+    return chunks
 
-rag_chain = (
-    {"context": vectorstore_retriever, "question": RunnablePassthrough()}
-    | prompt
-    | llm
-    | StrOutputParser()
-)
 
-query = "What are your pricing options?"
-result = rag_chain.invoke(query)
-print(f"Question: {query}")
-print(f"Answer: {result}")
+def sync_index(vectorstore, chunks, batch_size):
+    """
+    Updates the vector store so it contains exactly the given chunks:
+    chunks that disappeared are deleted and only new chunks are embedded.
+    """
+    existing_ids = set(vectorstore.get(include=[])["ids"])
 
+    stale_ids = list(existing_ids - chunks.keys())
+    if stale_ids:
+        print(f"Deleting {len(stale_ids)} outdated chunks...")
+        for start in range(0, len(stale_ids), batch_size):
+            vectorstore.delete(ids=stale_ids[start:start + batch_size])
+
+    new_ids = [chunk_id for chunk_id in chunks if chunk_id not in existing_ids]
+    print(f"{len(chunks) - len(new_ids)} chunks unchanged, {len(new_ids)} chunks to embed")
+    if not new_ids:
+        return
+
+    # Embed & insert new chunks batch by batch
+    start_time = time.perf_counter()
+    for start in range(0, len(new_ids), batch_size):
+        batch_ids = new_ids[start:start + batch_size]
+        vectorstore.add_documents([chunks[chunk_id] for chunk_id in batch_ids], ids=batch_ids)
+        indexed = start + len(batch_ids)
+        elapsed = time.perf_counter() - start_time
+        print(f"Indexed {indexed}/{len(new_ids)} chunks ({indexed / elapsed:.1f} chunks/sec)")
+
+
+def test_rag_chain(vectorstore):
+    print("Test RAG chain...")
+    # Semantic vector search
+    vectorstore_retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+    prompt = ChatPromptTemplate.from_template(RAG_SEARCH_PROMPT_TEMPLATE)
+    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.1)
+
+    rag_chain = (
+        {"context": vectorstore_retriever, "question": RunnablePassthrough()}
+        | prompt
+        | llm
+        | StrOutputParser()
+    )
+
+    query = "What are your pricing options?"
+    result = rag_chain.invoke(query)
+    print(f"Question: {query}")
+    print(f"Answer: {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update the knowledge base vector index.")
+    parser.add_argument("--data-dir", default="./data", help="Directory containing the documents to index")
+    parser.add_argument("--persist-dir", help="Directory of the Chroma vector store (defaults to VECTORSTORE_DIR)")
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=64, help="Number of chunks embedded per call")
+    parser.add_argument("--skip-test", action="store_true", help="Do not run the test RAG query")
+    args = parser.parse_args()
+
+    print("Loading & Chunking Docs...")
+    docs = load_documents(args.data_dir)
+    chunks = chunk_documents(docs, args.chunk_size, args.chunk_overlap)
+    print(f"{len(docs)} documents split into {len(chunks)} chunks")
+
+    print("Updating vector embeddings...")
+    config = WorkflowConfig.from_env()
+    embeddings = get_embeddings(
+        config.embedding_backend, config.embedding_model, config.embedding_cache_path
+    )
+    persist_dir = args.persist_dir or config.vectorstore_dir
+    vectorstore = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
+    sync_index(vectorstore, chunks, args.batch_size)
+
+    if not args.skip_test:
+        test_rag_chain(vectorstore)
+
+
+if __name__ == "__main__":
+    main()
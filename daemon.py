@@ -0,0 +1,18 @@
+import asyncio
+from dotenv import load_dotenv
+from prometheus_client import start_http_server
+from src.config import WorkflowConfig
+from src.daemon import InboxDaemon
+from src.graph import Workflow
+from src.log import setup_logging
+
+# Load all env variables
+load_dotenv()
+
+if __name__ == "__main__":
+    # Poll & process the inbox until interrupted (Ctrl+C / SIGTERM drain in-flight emails)
+    config = WorkflowConfig.from_env()
+    setup_logging(config.log_level, config.log_format, config.log_file)
+    if config.metrics_port:
+        start_http_server(config.metrics_port)
+    asyncio.run(InboxDaemon(Workflow(config)).run())
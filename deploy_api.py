@@ -1,18 +1,71 @@
+import time
+# Measures the import & startup time of the API
+STARTED = time.perf_counter()
+
+import json
+import uuid
+import logging
+import asyncio
+import secrets
 import uvicorn
-from fastapi import FastAPI
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sse_starlette.sse import EventSourceResponse
 from langserve import add_routes
+from src.config import WorkflowConfig
 from src.graph import Workflow
+from src.log import setup_logging
+from src.metrics import render_metrics, track_email
+from src.push import PushIngestion
+from src.resources import registry
+from src.state import Email
 from dotenv import load_dotenv
 
 # Load .env file
 load_dotenv()
 
+config = WorkflowConfig.from_env()
+setup_logging(config.log_level, config.log_format, config.log_file)
+
+logger = logging.getLogger("main")
+
+# Build the workflow once, it is shared by the API routes & the push workers.
+# Its LLM, vector store & Gmail clients are only created by the warm-up, after the server starts
+workflow = Workflow(config)
+push_ingestion = PushIngestion(workflow) if workflow.config.push_ingestion else None
+import_seconds = time.perf_counter() - STARTED
+logger.info(f"API imported in {import_seconds:.2f}s")
+
+# Background creation of the clients, reported by the readiness probe
+warm_up = {"task": None, "seconds": None}
+
+
+async def warm_up_workflow():
+    start = time.perf_counter()
+    await workflow.nodes.ensure_ready()
+    warm_up["seconds"] = time.perf_counter() - start
+    logger.info(f"Workflow ready in {warm_up['seconds']:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up["task"] = asyncio.create_task(warm_up_workflow())
+    # Consume the queued push notifications while the API is running
+    if push_ingestion:
+        await push_ingestion.start()
+    yield
+    if push_ingestion:
+        await push_ingestion.stop()
+
 
 app = FastAPI(
     title="Gmail Automation",
     version="1.0",
     description="LangGraph backend for the AI Gmail automation workflow",
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -26,7 +79,7 @@ app.add_middleware(
 )
 
 def get_runnable():
-    return  Workflow().app
+    return workflow.app
 
 # Fetch LangGraph Automation runnable which generates the workouts
 runnable = get_runnable()
@@ -34,6 +87,115 @@ runnable = get_runnable()
 # Create the Fast API route to invoke the runnable
 add_routes(app, runnable)
 
+if push_ingestion:
+    @app.post("/gmail/push", status_code=204)
+    async def gmail_push(request: Request, token: str = ""):
+        """Receives the Gmail Pub/Sub push notifications and queues them (acknowledged with a 2xx)."""
+        expected_token = workflow.config.push_verification_token
+        if not secrets.compare_digest(token, expected_token):
+            raise HTTPException(status_code=403, detail="Invalid verification token")
+        try:
+            envelope = await request.json()
+            await asyncio.to_thread(push_ingestion.handle_notification, envelope)
+        except (KeyError, TypeError, ValueError) as error:
+            raise HTTPException(status_code=400, detail=f"Invalid push message: {error}")
+        return Response(status_code=204)
+
+@app.get("/health/live")
+def liveness():
+    """Liveness probe: the server is running."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness(response: Response):
+    """Readiness probe: 503 until the LLM, vector store & Gmail clients are created."""
+    task = warm_up["task"]
+    status = "ready"
+    error = None
+    if task is None or not task.done():
+        status = "warming_up"
+    elif task.exception() is not None:
+        # Retried on the next probe
+        status, error = "failed", str(task.exception())
+        warm_up["task"] = asyncio.create_task(warm_up_workflow())
+    if status != "ready":
+        response.status_code = 503
+    return {
+        "status": status,
+        "error": error,
+        "import_seconds": round(import_seconds, 3),
+        "warm_up_seconds": round(warm_up["seconds"], 3) if warm_up["seconds"] else None,
+        **registry.status(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics of the workflow (nodes, agents, LLM calls, caches & Gmail calls)."""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+class BatchEmail(BaseModel):
+    id: Optional[str] = Field(None, description="Email identifier, generated if empty")
+    threadId: Optional[str] = Field(None, description="Thread identifier, defaults to a thread of its own")
+    sender: str = Field(..., description="Email address of the sender")
+    subject: str = Field("", description="Subject line of the email")
+    body: str = Field(..., description="Body content of the email")
+
+    def to_email(self):
+        email_id = self.id or str(uuid.uuid4())
+        return Email(
+            id=email_id, threadId=self.threadId or f"api:{email_id}", messageId="", references="",
+            sender=self.sender, subject=self.subject, body=self.body
+        )
+
+
+class ProcessBatchRequest(BaseModel):
+    emails: List[BatchEmail]
+
+
+@app.post("/process_batch")
+async def process_batch(request: ProcessBatchRequest):
+    """
+    Categorizes & writes the replies of many emails (no Gmail draft is created),
+    each result is streamed as a server-sent event as soon as its email is done.
+    """
+    state = {"emails": [email.to_email() for email in request.emails]}
+    if not state["emails"]:
+        raise HTTPException(status_code=400, detail="No emails to process")
+    if workflow.config.triage_mode == "batch":
+        state.update(await workflow.reply_nodes.triage_inbox_emails(state))
+    semaphore = asyncio.Semaphore(workflow.config.max_concurrency)
+
+    async def process(email_state):
+        email = email_state["current_email"]
+        async with semaphore:
+            try:
+                with track_email(email.id) as record:
+                    result = await workflow.reply_app.ainvoke(email_state)
+                    record.finish(result)
+            except Exception as error:
+                return "error", {"id": email.id, "error": str(error)}
+        return "result", {
+            "id": email.id,
+            "category": result.get("email_category"),
+            "reply": result.get("generated_email"),
+            "approved": result.get("sendable", False),
+        }
+
+    async def stream_results():
+        tasks = [asyncio.create_task(process(send.arg)) for send in workflow.reply_nodes.dispatch_emails(state)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                event, data = await next_result
+                yield {"event": event, "data": json.dumps(data)}
+            yield {"event": "end", "data": json.dumps({"processed": len(tasks)})}
+        finally:
+            # Stop the remaining emails if the client disconnects
+            for task in tasks:
+                task.cancel()
+
+    return EventSourceResponse(stream_results())
+
 def main():
     # Start the API
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,22 @@
+# Production settings: gunicorn -c gunicorn.conf.py deploy_api:app
+import os
+import multiprocessing
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+# Nodes are async, so each worker serves many concurrent requests: one worker per core is enough
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# /process_batch streams until every email of the batch is processed
+timeout = int(os.environ.get("WORKER_TIMEOUT", 300))
+graceful_timeout = 60
+keepalive = 5
+# Each worker builds its own workflow & clients (SQLite connections & sockets can't be shared across processes),
+# the push ingestion queue is consumed by a single worker (see src/push.py)
+preload_app = False
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, /metrics merges the metrics of all workers: drop the dead ones
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,9 @@
-from colorama import Fore, Style
+import asyncio
+import logging
+import argparse
 from src.graph import Workflow
+from src.config import WorkflowConfig
+from src.log import setup_logging
 from dotenv import load_dotenv
 
 # Load all env variables
@@ -8,33 +12,45 @@ load_dotenv()
 # config 
 config = {'recursion_limit': 100}
 
-workflow = Workflow()
+parser = argparse.ArgumentParser(description="Process the unanswered inbox emails.")
+parser.add_argument(
+    "--resume", action="store_true",
+    help="Only finish the emails left unfinished by an interrupted run (from their checkpoints)"
+)
+args = parser.parse_args()
+
+workflow_config = WorkflowConfig.from_env()
+setup_logging(workflow_config.log_level, workflow_config.log_format, workflow_config.log_file)
+logger = logging.getLogger("main")
+
+workflow = Workflow(workflow_config)
 app = workflow.app
 
 initial_state = {
-    "emails": [],
-    "current_email": {
-      "id": "",
-      "threadId": "",
-      "messageId": "",
-      "references": "",
-      "sender": "",
-      "subject": "",
-      "body": ""
-    },
-    "email_category": "",
-    "generated_email": "",
-    "rag_queries": [],
-    "retrieved_documents": "",
-    "writer_messages": [],
-    "sendable": False,
-    "trials": 0
+    "emails": []
 }
 
-# Run the automation
-print(Fore.GREEN + "Starting workflow..." + Style.RESET_ALL)
-for output in app.stream(initial_state, config):
-    for key, value in output.items():
-        print(Fore.CYAN + f"Finished running: {key}:" + Style.RESET_ALL)
+async def run():
+    if args.resume:
+        logger.info("Resuming interrupted emails...")
+        resumed = await workflow.resume()
+        logger.info(f"Resumed {resumed} emails")
+    else:
+        # Run the automation
+        logger.info("Starting workflow...")
+        async for output in app.astream(initial_state, config):
+            for key, value in output.items():
+                logger.info(f"Finished running: {key}")
+
+asyncio.run(run())
+
+# Report LLM token usage per agent (the agents are not created just for it when no LLM was called)
+token_usage = workflow.nodes.token_usage
+if token_usage is not None:
+    for agent, usage in token_usage.summary().items():
+        logger.info(
+            f"{agent}: {usage['calls']} calls, {usage['prompt_tokens']} prompt tokens "
+            f"({usage['cached_tokens']} cached), {usage['completion_tokens']} completion tokens"
+        )
 
 
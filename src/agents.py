@@ -1,72 +1,136 @@
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_groq import ChatGroq
-from langchain_chroma import Chroma
+import os
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from .structure_outputs import *
 from .prompts import *
+from .config import WorkflowConfig
+from .retrievers import HybridRetriever, CrossEncoderReranker
+from .tokens import TokenUsageCallback
+from .metrics import AgentMetricsCallback
+from .llm_router import LLMRouter
+from .resources import shared_llm_router, shared_embeddings, shared_vectorstore
 
 class Agents():
-    def __init__(self):
-        # Choose which LLMs to use for each agent (GPT-4o, Gemini, LLAMA3,...)
-        llama = ChatGroq(model_name="llama-3.3-70b-versatile", temperature=0.1)
-        gemini = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.1)
-        
+    def __init__(self, config: WorkflowConfig = None, router: LLMRouter = None, embeddings=None):
+        config = config or WorkflowConfig.from_env()
+
+        # Pool of LLMs shared by the agents (GPT-4o, Gemini, LLAMA3,...), with rate limiting & failover
+        # (clients are shared by every Agents of the process unless given)
+        self.router = router or shared_llm_router(config)
+        llm = self.router.chat()
+
         # QA assistant chat
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-        vectorstore = Chroma(persist_directory="db", embedding_function=embeddings)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+        if embeddings is None:
+            embeddings = shared_embeddings(config)
+            vectorstore = shared_vectorstore(config)
+        else:
+            from langchain_chroma import Chroma
+            vectorstore = Chroma(persist_directory=config.vectorstore_dir, embedding_function=embeddings)
+        self.embeddings = embeddings
+        if config.retriever_mode == "hybrid":
+            # Vector search fused with BM25 keyword search (and optional reranking)
+            retriever = HybridRetriever(
+                vectorstore=vectorstore,
+                k=config.retriever_k,
+                reranker=CrossEncoderReranker(config.reranker_model) if config.reranker_model else None,
+                index_path=os.path.join(config.vectorstore_dir, "chroma.sqlite3")
+            )
+        else:
+            retriever = vectorstore.as_retriever(search_kwargs={"k": config.retriever_k})
+        self.retriever = retriever
+
+        # Records prompt/completion/cached tokens per agent & per email
+        self.token_usage = TokenUsageCallback()
+        # Exports agent wall time, LLM calls & tokens as Prometheus metrics
+        self.metrics = AgentMetricsCallback()
+
+        # Every prompt starts with its static system part so providers can cache the prefix
+        def structured_agent(name, system_prompt, input_template, output_schema):
+            prompt = ChatPromptTemplate.from_messages(
+                [("system", system_prompt), ("human", input_template)]
+            )
+            return self._track(name, prompt | self.router.structured(output_schema))
 
         # Categorize email chain
-        email_category_prompt = PromptTemplate(
-            template=CATEGORIZE_EMAIL_PROMPT, 
-            input_variables=["email"]
-        )
-        self.categorize_email = (
-            email_category_prompt | 
-            llama.with_structured_output(CategorizeEmailOutput)
+        self.categorize_email = structured_agent(
+            "categorize_email", CATEGORIZE_EMAIL_PROMPT, CATEGORIZE_EMAIL_INPUT, CategorizeEmailOutput
         )
 
         # Used to design queries for RAG retrieval
-        generate_query_prompt = PromptTemplate(
-            template=GENERATE_RAG_QUERIES_PROMPT, 
-            input_variables=["email"]
+        self.design_rag_queries = structured_agent(
+            "design_rag_queries", GENERATE_RAG_QUERIES_PROMPT, GENERATE_RAG_QUERIES_INPUT, RAGQueriesOutput
+        )
+
+        # Categorize email & design RAG queries in a single call
+        self.triage_email = structured_agent(
+            "triage_email", TRIAGE_EMAIL_PROMPT, TRIAGE_EMAIL_INPUT, TriageEmailOutput
+        )
+
+        # Categorize several emails in a single call
+        self.batch_categorize_emails = structured_agent(
+            "batch_categorize_emails", BATCH_CATEGORIZE_EMAILS_PROMPT,
+            BATCH_CATEGORIZE_EMAILS_INPUT, BatchCategorizeEmailOutput
         )
-        self.design_rag_queries = (
-            generate_query_prompt | 
-            llama.with_structured_output(RAGQueriesOutput)
+
+        # Design RAG queries for several emails in a single call
+        self.batch_design_rag_queries = structured_agent(
+            "batch_design_rag_queries", BATCH_GENERATE_RAG_QUERIES_PROMPT,
+            BATCH_GENERATE_RAG_QUERIES_INPUT, BatchRAGQueriesOutput
         )
         
         # Generate answer to queries using RAG
-        qa_prompt = ChatPromptTemplate.from_template(GENERATE_RAG_ANSWER_PROMPT)
-        self.generate_rag_answer = (
+        qa_prompt = ChatPromptTemplate.from_messages(
+            [("system", GENERATE_RAG_ANSWER_PROMPT), ("human", GENERATE_RAG_ANSWER_INPUT)]
+        )
+        self.generate_rag_answer = self._track("generate_rag_answer", (
             {"context": retriever, "question": RunnablePassthrough()}
             | qa_prompt
-            | llama
+            | llm
+            | StrOutputParser()
+        ))
+
+        # Answer all queries at once from their merged retrieved context
+        multi_qa_prompt = ChatPromptTemplate.from_messages(
+            [("system", GENERATE_RAG_ANSWERS_PROMPT), ("human", GENERATE_RAG_ANSWERS_INPUT)]
+        )
+        self.generate_rag_answers = self._track("generate_rag_answers", (
+            multi_qa_prompt
+            | llm
             | StrOutputParser()
+        ))
+
+        # Summarize the earlier messages of a thread, extending its previous summary
+        summarize_thread_prompt = ChatPromptTemplate.from_messages(
+            [("system", SUMMARIZE_THREAD_PROMPT), ("human", SUMMARIZE_THREAD_INPUT)]
         )
+        self.summarize_thread = self._track("summarize_thread", (
+            summarize_thread_prompt
+            | llm
+            | StrOutputParser()
+        ))
 
         # Used to write a draft email based on category and related informations
+        # (the email information comes before the drafts/feedback history so retries share the prefix)
         writer_prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", EMAIL_WRITER_PROMPT),
-                MessagesPlaceholder("history"),
-                ("human", "{email_information}")
+                ("human", "{email_information}"),
+                MessagesPlaceholder("history")
             ]
         )
-        self.email_writer = (
+        self.email_writer = self._track("email_writer", (
             writer_prompt | 
-            llama.with_structured_output(WriterOutput)
-        )
+            self.router.structured(WriterOutput)
+        ))
 
         # Verify the generated email
-        proofreader_prompt = PromptTemplate(
-            template=EMAIL_PROOFREADER_PROMPT, 
-            input_variables=["initial_email", "generated_email"]
+        self.email_proofreader = structured_agent(
+            "email_proofreader", EMAIL_PROOFREADER_PROMPT, EMAIL_PROOFREADER_INPUT, ProofReaderOutput
+        )
+
+    def _track(self, name, chain):
+        """Names the agent chain and attaches the token accounting & metrics callbacks."""
+        return chain.with_config(
+            run_name=name, metadata={"agent": name}, callbacks=[self.token_usage, self.metrics]
         )
-        self.email_proofreader = (
-            proofreader_prompt | 
-            llama.with_structured_output(ProofReaderOutput) 
-        )
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from .metrics import record_cache_lookup
+
+
+class SemanticCache:
+    """
+    In-memory response cache keyed on the exact text hash and on embedding similarity.
+    Entries expire after a TTL, the least recently used ones are evicted once the cache
+    is full and everything is dropped when the vector store index is rebuilt.
+    """
+    def __init__(
+        self,
+        embeddings=None,
+        similarity_threshold=0.95,
+        ttl_seconds=86400,
+        max_size=1000,
+        index_path="db/chroma.sqlite3",
+        name="cache"
+    ):
+        self.name = name
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.index_path = index_path
+        self.hits = 0
+        self.misses = 0
+        # text hash -> (vector, value, created_at), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._index_version = self._get_index_version()
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self):
+        """Similarity lookups only run when a threshold below 1 is configured."""
+        return self.embeddings is not None and self.similarity_threshold < 1
+
+    def embed(self, texts):
+        """Embeds the texts in one call, returns None for each text if lookups are exact only."""
+        if not self.semantic:
+            return [None] * len(texts)
+        return [np.asarray(vector, dtype=np.float32) for vector in self.embeddings.embed_documents(texts)]
+
+    def lookup(self, text, vector=None):
+        """
+        Returns the cached value for the text, or None on a miss.
+
+        @param text: Query or email text
+        @param vector: Precomputed embedding of the text (see embed)
+        """
+        key = self._hash(text)
+        with self._lock:
+            self._check_index_version()
+            self._evict_expired()
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache_lookup(self.name, hit=True)
+                return self._entries[key][1]
+            needs_vector = self.semantic and vector is None and bool(self._entries)
+
+        # The embedding call is remote, other lookups and stores must not wait behind it
+        if needs_vector:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+
+        with self._lock:
+            if self.semantic and self._entries and vector is not None:
+                best_key, best_score = None, -1.0
+                for entry_key, (entry_vector, _, _) in self._entries.items():
+                    score = self._cosine_similarity(vector, entry_vector)
+                    if score > best_score:
+                        best_key, best_score = entry_key, score
+                if best_score >= self.similarity_threshold:
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    record_cache_lookup(self.name, hit=True)
+                    return self._entries[best_key][1]
+
+            self.misses += 1
+            record_cache_lookup(self.name, hit=False)
+            return None
+
+    def store(self, text, value, vector=None):
+        """Adds a value to the cache, evicting the least recently used entry if full."""
+        if self.semantic and vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        with self._lock:
+            key = self._hash(text)
+            self._entries[key] = (vector, value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [
+            key for key, (_, _, created_at) in self._entries.items()
+            if now - created_at > self.ttl_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+
+    def _check_index_version(self):
+        # Cached answers are stale once the knowledge base index is rebuilt
+        index_version = self._get_index_version()
+        if index_version != self._index_version:
+            self._entries.clear()
+            self._index_version = index_version
+
+    def _get_index_version(self):
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha256(text.strip().lower().encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cosine_similarity(a, b):
+        norm = np.linalg.norm(a) * np.linalg.norm(b)
+        return float(np.dot(a, b) / norm) if norm else 0.0
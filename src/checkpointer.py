@@ -0,0 +1,42 @@
+import asyncio
+import sqlite3
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# Types of the graph state stored in the checkpoints, deserialized when a run is resumed
+CHECKPOINT_TYPES = [("src.state", "Email")]
+
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """
+    SQLite checkpointer usable from both sync and async graph runs: the async methods
+    run the (locked, thread-safe) sync ones in a worker thread, so a single connection
+    is shared by every thread & event loop of the process.
+    """
+    @classmethod
+    def from_path(cls, db_path):
+        saver = cls(
+            sqlite3.connect(db_path, check_same_thread=False),
+            serde=JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_TYPES)
+        )
+        saver.setup()
+        return saver
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,135 @@
+import re
+import sys
+import json
+import math
+import logging
+from email.utils import parseaddr
+from collections import Counter, defaultdict
+from .structure_outputs import EmailCategory
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Headers set by mailing lists, newsletters and automatic replies
+BULK_HEADERS = ("list-unsubscribe", "list-id")
+AUTO_REPLY_HEADERS = ("x-autoreply", "x-autorespond")
+# Local parts of automated sender addresses (e.g. "noreply@", "bounces+123@"), the display name is ignored
+AUTOMATED_SENDER_PATTERN = re.compile(
+    r"(no-?reply|do-?not-?reply|mailer-daemon|postmaster|notifications?|newsletters?|bounces?)([-+._].*)?",
+    re.IGNORECASE
+)
+# A sender address alone is weak evidence, it stays below the default threshold so the LLM decides
+AUTOMATED_SENDER_CONFIDENCE = 0.8
+AUTO_REPLY_SUBJECT_PATTERN = re.compile(
+    r"^(automatic reply|auto[- ]?reply|out of (the )?office|undeliverable|delivery status notification)",
+    re.IGNORECASE
+)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class EmailPreClassifier:
+    """
+    Cheap local email classifier run before the LLM: header & sender rules for
+    automated emails, then an optional Naive Bayes model trained on labeled emails.
+    Only predictions above the confidence threshold skip the LLM.
+    """
+    def __init__(self, model_path=None):
+        self.model = None
+        if model_path:
+            try:
+                with open(model_path) as f:
+                    self.model = json.load(f)
+            except FileNotFoundError:
+                logger.warning(f"Pre-classifier model {model_path} not found, only header rules are used")
+
+    def predict(self, email):
+        """
+        Predicts the email category.
+
+        @param email: Email to classify
+        @return: Tuple of (EmailCategory or None, confidence between 0 and 1)
+        """
+        category, confidence = self._apply_rules(email)
+        if category is not None:
+            return category, confidence
+        if self.model is not None:
+            return self._predict_model(f"{email.subject}\n{email.body}")
+        return None, 0.0
+
+    def _apply_rules(self, email):
+        headers = {name.lower(): value for name, value in email.headers.items()}
+        auto_submitted = headers.get("auto-submitted", "no").lower()
+        if auto_submitted != "no" or any(name in headers for name in AUTO_REPLY_HEADERS):
+            return EmailCategory.unrelated, 0.99
+        if headers.get("precedence", "").lower() in ("bulk", "list", "junk"):
+            return EmailCategory.unrelated, 0.97
+        if any(name in headers for name in BULK_HEADERS):
+            return EmailCategory.unrelated, 0.95
+        if AUTO_REPLY_SUBJECT_PATTERN.match(email.subject):
+            return EmailCategory.unrelated, 0.95
+        local_part = parseaddr(email.sender)[1].rpartition("@")[0]
+        if AUTOMATED_SENDER_PATTERN.fullmatch(local_part):
+            return EmailCategory.unrelated, AUTOMATED_SENDER_CONFIDENCE
+        return None, 0.0
+
+    def _predict_model(self, text):
+        tokens = tokenize(text)
+        vocabulary_size = len(self.model["vocabulary"])
+        log_probs = {}
+        for category, stats in self.model["categories"].items():
+            log_prob = math.log(stats["prior"])
+            denominator = stats["total_tokens"] + vocabulary_size
+            for token in tokens:
+                if token in self.model["vocabulary"]:
+                    log_prob += math.log((stats["token_counts"].get(token, 0) + 1) / denominator)
+            log_probs[category] = log_prob
+
+        # Normalize log probabilities into a confidence score
+        max_log_prob = max(log_probs.values())
+        total = sum(math.exp(value - max_log_prob) for value in log_probs.values())
+        best = max(log_probs, key=log_probs.get)
+        return EmailCategory(best), 1 / total
+
+    @staticmethod
+    def train(samples, model_path):
+        """
+        Trains the Naive Bayes model and saves it as JSON.
+
+        @param samples: List of (email text, category) tuples
+        @param model_path: Path of the model file to write
+        """
+        token_counts = defaultdict(Counter)
+        documents = Counter()
+        for text, category in samples:
+            category = EmailCategory(category).value
+            documents[category] += 1
+            token_counts[category].update(tokenize(text))
+
+        vocabulary = sorted({token for counts in token_counts.values() for token in counts})
+        model = {
+            "vocabulary": {token: True for token in vocabulary},
+            "categories": {
+                category: {
+                    "prior": documents[category] / len(samples),
+                    "total_tokens": sum(token_counts[category].values()),
+                    "token_counts": dict(token_counts[category]),
+                }
+                for category in documents
+            },
+        }
+        with open(model_path, "w") as f:
+            json.dump(model, f)
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.classifier <labeled_emails.jsonl> <model.json>
+    # Each line of the dataset is {"text": "...", "category": "product_enquiry"}
+    dataset_path, output_path = sys.argv[1], sys.argv[2]
+    with open(dataset_path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    EmailPreClassifier.train([(row["text"], row["category"]) for row in rows], output_path)
+    print(f"Pre-classifier trained on {len(rows)} emails and saved to {output_path}")
@@ -0,0 +1,259 @@
+import os
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+
+class WorkflowConfig(BaseModel):
+    max_concurrency: int = Field(
+        5,
+        description="Maximum number of emails processed at the same time."
+    )
+    incremental_sync: bool = Field(
+        False,
+        description="Only fetch the emails added since the last run using the Gmail history API."
+    )
+    sync_db_path: str = Field(
+        "gmail_sync.db",
+        description="Path of the SQLite file storing the Gmail sync state and thread ledger."
+    )
+    write_batch_size: int = Field(
+        50,
+        description="Maximum number of replies (drafts or sends) written to Gmail in one batch request."
+    )
+    write_flush_seconds: float = Field(
+        0.2,
+        description="Time the outbound writer waits to gather the replies of concurrent emails into one batch."
+    )
+    write_max_attempts: int = Field(
+        5,
+        description="Attempts of a Gmail write failing on quota or server errors (retried with backoff) before the email fails."
+    )
+    email_body_max_chars: int = Field(
+        8000,
+        description="Maximum number of characters kept from an email body, larger bodies are truncated (0 keeps everything)."
+    )
+    html_parser: Literal["auto", "selectolax", "lxml", "html.parser"] = Field(
+        "auto",
+        description="Parser of the HTML bodies, 'auto' uses selectolax or lxml when installed, BeautifulSoup otherwise."
+    )
+    strip_quoted_text: bool = Field(
+        True,
+        description="Remove the quoted previous messages and signatures from the email bodies."
+    )
+
+    poll_interval_seconds: float = Field(
+        15,
+        description="Time between two inbox polls of the daemon (`python daemon.py`)."
+    )
+    poll_jitter_seconds: float = Field(
+        3,
+        description="Random variation added to the daemon poll interval."
+    )
+    email_max_attempts: int = Field(
+        3,
+        description="Number of failed attempts of an email in the daemon before it is recorded as rejected."
+    )
+    push_ingestion: bool = Field(
+        False,
+        description="Process emails from Gmail push notifications received by the API on /gmail/push."
+    )
+    push_topic: Optional[str] = Field(
+        None,
+        description="Pub/Sub topic the Gmail watch publishes to (e.g. projects/my-project/topics/gmail), the watch is renewed daily."
+    )
+    push_verification_token: Optional[str] = Field(
+        None,
+        description="Secret expected in the `token` query parameter of the push endpoint (set on the Pub/Sub subscription URL), required by push ingestion."
+    )
+    push_workers: int = Field(
+        4,
+        description="Number of workers processing the emails received by push notifications."
+    )
+    work_queue_path: str = Field(
+        "work_queue.db",
+        description="SQLite file of the durable queue holding the push notifications & emails to process."
+    )
+    queue_max_attempts: int = Field(
+        5,
+        description="Number of attempts of a queued job before it is marked as failed."
+    )
+    checkpoint_db_path: str = Field(
+        "checkpoints.db",
+        description="SQLite file checkpointing each email run so interrupted runs resume (empty to disable)."
+    )
+
+    rag_mode: Literal["parallel", "merged"] = Field(
+        "parallel",
+        description=(
+            "How RAG queries are answered: 'parallel' runs one RAG chain per query concurrently, "
+            "'merged' answers all queries with a single LLM call over their merged context."
+        )
+    )
+    rag_max_concurrency: int = Field(
+        3,
+        description="Maximum number of RAG queries answered at the same time."
+    )
+
+    response_cache: bool = Field(
+        True,
+        description="Cache RAG answers and drafted replies to skip the LLM on repeated questions."
+    )
+    cache_similarity_threshold: float = Field(
+        0.95,
+        description="Minimum cosine similarity for a RAG query to reuse a cached answer."
+    )
+    draft_cache_similarity_threshold: float = Field(
+        1.0,
+        description="Minimum cosine similarity for an email to reuse a cached draft (1 means exact match only)."
+    )
+    cache_ttl_seconds: int = Field(
+        86400,
+        description="Time after which cached responses expire."
+    )
+    cache_max_size: int = Field(
+        1000,
+        description="Maximum number of entries kept in each response cache."
+    )
+
+    embedding_backend: Literal["google", "local"] = Field(
+        "google",
+        description="Embedding model provider: 'google' (Gemini API) or 'local' (CPU model, needs fastembed)."
+    )
+    embedding_model: Optional[str] = Field(
+        None,
+        description="Embedding model name, defaults to the backend's default model."
+    )
+    embedding_cache_path: str = Field(
+        "embeddings_cache.db",
+        description="SQLite file caching computed embeddings (empty to disable)."
+    )
+
+    vectorstore_dir: str = Field(
+        "db",
+        description="Directory of the Chroma vector store built by create_index.py."
+    )
+    retriever_mode: Literal["vector", "hybrid"] = Field(
+        "hybrid",
+        description="Knowledge base retrieval: 'vector' similarity only or 'hybrid' vector + BM25 keyword search."
+    )
+    retriever_k: int = Field(
+        3,
+        description="Number of chunks retrieved for each RAG query."
+    )
+    reranker_model: Optional[str] = Field(
+        None,
+        description="Cross-encoder model reranking hybrid results (needs sentence-transformers), disabled if empty."
+    )
+
+    pre_classifier: bool = Field(
+        True,
+        description="Classify obvious emails (newsletters, notifications, auto-replies) locally before the LLM."
+    )
+    pre_classifier_model_path: Optional[str] = Field(
+        None,
+        description="Naive Bayes model trained with `python -m src.classifier`, header rules only if empty."
+    )
+    pre_classifier_threshold: float = Field(
+        0.9,
+        description="Minimum pre-classifier confidence to skip the LLM categorization."
+    )
+
+    triage_mode: Literal["separate", "fused", "batch"] = Field(
+        "separate",
+        description=(
+            "How emails are categorized & RAG queries designed: 'separate' makes two LLM calls per email, "
+            "'fused' a single call returning both, 'batch' handles many inbox emails per LLM call."
+        )
+    )
+    llm_context_window: int = Field(
+        32768,
+        description="Context window (in tokens) of the LLM, used to size the batch triage chunks."
+    )
+    batch_max_emails: int = Field(
+        20,
+        description="Maximum number of emails sent in a single batch triage call."
+    )
+
+    writer_history_mode: Literal["incremental", "full"] = Field(
+        "incremental",
+        description=(
+            "What rewrites send to the writer: 'incremental' only the previous draft & proofreader feedback, "
+            "'full' the whole drafts/feedback history."
+        )
+    )
+    writer_token_budget: int = Field(
+        6000,
+        description="Maximum (estimated) prompt tokens of a writer call, history & information are trimmed to fit."
+    )
+    thread_context: bool = Field(
+        True,
+        description="Give the writer the earlier messages of the email thread (older ones summarized)."
+    )
+    thread_context_token_budget: int = Field(
+        1500,
+        description="Maximum (estimated) tokens of the thread context, the latest messages are kept as is and the older ones summarized."
+    )
+
+    llm_models: List[str] = Field(
+        ["groq:llama-3.3-70b-versatile", "google:gemini-1.5-flash"],
+        description=(
+            "Pool of 'provider:model' chat models used by the agents (comma separated in the environment), "
+            "later models are fallbacks when earlier ones are rate limited or time out."
+        )
+    )
+    llm_requests_per_second: float = Field(
+        1.0,
+        description="Maximum number of LLM requests per second sent to each provider."
+    )
+    llm_max_rounds: int = Field(
+        3,
+        description="Number of passes over the whole model pool (with backoff) before an LLM call fails."
+    )
+    llm_timeout: Optional[float] = Field(
+        60.0,
+        description="Seconds after which an LLM call times out and fails over to the next model."
+    )
+
+    log_level: str = Field(
+        "INFO",
+        description="Minimum level of the logged messages (DEBUG, INFO, WARNING, ERROR)."
+    )
+    log_format: Literal["text", "json"] = Field(
+        "text",
+        description="'text' for colored console logs, 'json' for one JSON object per line (log collectors)."
+    )
+    log_file: Optional[str] = Field(
+        None,
+        description="Also write the logs to this file."
+    )
+    metrics_port: Optional[int] = Field(
+        None,
+        description="Port of the Prometheus /metrics endpoint started by the daemon (the API serves /metrics itself)."
+    )
+
+    @field_validator("llm_models", mode="before")
+    @classmethod
+    def _split_models(cls, value):
+        if isinstance(value, str):
+            return [model.strip() for model in value.split(",") if model.strip()]
+        return value
+
+    @model_validator(mode="after")
+    def _require_push_token(self):
+        # The push endpoint triggers Gmail fetches & LLM calls, it never runs unauthenticated
+        if self.push_ingestion and not self.push_verification_token:
+            raise ValueError("push_ingestion requires a push_verification_token")
+        return self
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build the workflow configuration from environment variables,
+        falling back to the defaults for anything that is not set.
+        """
+        overrides = {}
+        for name in cls.model_fields:
+            value = os.environ.get(name.upper())
+            if value is not None:
+                overrides[name] = value
+        return cls(**overrides)
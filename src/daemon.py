@@ -0,0 +1,136 @@
+import os
+import random
+import signal
+import asyncio
+import logging
+from collections import OrderedDict
+from .graph import Workflow
+from .state import Email
+from .tools.SyncStore import REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Number of finished email ids remembered to avoid processing them again
+MAX_HANDLED_EMAILS = 10000
+
+
+class InboxDaemon:
+    """
+    Long-running inbox processor replacing one-shot runs: the workflow (Gmail service,
+    LLM clients, vector store) is built once and kept warm, the inbox is polled on an
+    interval with jitter and new emails are processed while the next polls keep running.
+    """
+    def __init__(self, workflow: Workflow = None, poll_interval=None, poll_jitter=None):
+        self.workflow = workflow or Workflow()
+        config = self.workflow.config
+        self.poll_interval = config.poll_interval_seconds if poll_interval is None else poll_interval
+        self.poll_jitter = config.poll_jitter_seconds if poll_jitter is None else poll_jitter
+        # email id -> task of the emails being processed
+        self._in_flight = {}
+        self._handled = OrderedDict()
+        # email id -> failed attempts of the emails retried on the next polls
+        self._failures = {}
+        self._stop = None
+        self._semaphore = None
+
+    async def run(self):
+        """Polls & processes the inbox until stopped, then drains the in-flight emails."""
+        self._stop = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.workflow.config.max_concurrency)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Signal handlers are only available in the main thread on Unix
+                pass
+
+        logger.info(f"Inbox daemon started, polling every ~{self.poll_interval}s")
+        while not self._stop.is_set():
+            try:
+                await self.poll()
+            except Exception as error:
+                logger.error(f"Inbox poll failed: {error}")
+
+            # Jitter spreads the polls of several daemons sharing the same API quota
+            delay = max(0.0, self.poll_interval + random.uniform(-self.poll_jitter, self.poll_jitter))
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+        await self.drain()
+
+    def stop(self):
+        """First call stops polling & drains the in-flight emails, a second call exits right away."""
+        if self._stop.is_set():
+            logger.error("Forced exit, run `python main.py --resume` to finish interrupted emails")
+            os._exit(1)
+        logger.info("Shutting down, finishing in-flight emails...")
+        self._stop.set()
+
+    async def poll(self):
+        """
+        Fetches the inbox and starts processing the new emails without waiting for them.
+
+        @return: Number of emails started
+        """
+        nodes = self.workflow.nodes
+        await nodes.ensure_ready()
+        # Emails in flight or already handled are not downloaded again
+        skip_ids = set(self._in_flight) | set(self._handled)
+        fetched = await asyncio.to_thread(nodes.gmail_tools.fetch_unanswered_emails, skip_ids=skip_ids)
+        emails = [Email(**email) for email in fetched if email["id"] not in skip_ids]
+        if not emails:
+            return 0
+
+        state = {"emails": emails}
+        if self.workflow.config.triage_mode == "batch":
+            state.update(await nodes.triage_inbox_emails(state))
+
+        sends = nodes.dispatch_emails(state)
+        for send in sends:
+            email_id = send.arg["current_email"].id
+            self._in_flight[email_id] = asyncio.create_task(self._process_email(email_id, send.arg))
+        return len(sends)
+
+    async def _process_email(self, email_id, email_state):
+        try:
+            async with self._semaphore:
+                await self.workflow.run_email(email_state)
+        except Exception as error:
+            attempts = self._failures.get(email_id, 0) + 1
+            if attempts < self.workflow.config.email_max_attempts:
+                # Not marked as handled: the next poll retries it from its checkpoint
+                logger.error(f"Processing email {email_id} failed (attempt {attempts}): {error}")
+                self._failures[email_id] = attempts
+            else:
+                logger.error(f"Processing email {email_id} failed {attempts} times, giving up: {error}")
+                await self._give_up(email_state["current_email"])
+        else:
+            self._mark_handled(email_id)
+        finally:
+            self._in_flight.pop(email_id, None)
+
+    async def _give_up(self, email: Email):
+        """Records the email as rejected so it is not fetched again until a new message arrives in its thread."""
+        try:
+            await asyncio.to_thread(
+                self.workflow.nodes.gmail_tools.sync_store.update_thread, email.threadId, email.id, REJECTED
+            )
+        except Exception as error:
+            logger.error(f"Recording email {email.id} as rejected failed: {error}")
+        self._mark_handled(email.id)
+
+    def _mark_handled(self, email_id):
+        self._failures.pop(email_id, None)
+        self._handled[email_id] = True
+        if len(self._handled) > MAX_HANDLED_EMAILS:
+            self._handled.popitem(last=False)
+
+    async def drain(self):
+        """Waits for every fetched email to be processed."""
+        if self._in_flight:
+            logger.info(f"Waiting for {len(self._in_flight)} in-flight emails...")
+            await asyncio.gather(*self._in_flight.values())
+        logger.info("Inbox daemon stopped")
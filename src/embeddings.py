@@ -0,0 +1,110 @@
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODELS = {
+    "google": "models/text-embedding-004",
+    "local": "BAAI/bge-small-en-v1.5",
+}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with a persistent content-hash -> vector cache stored in SQLite,
+    so a text is only sent to the embedding model the first time it is seen.
+    """
+    def __init__(self, underlying: Embeddings, db_path="embeddings_cache.db", namespace=""):
+        self.underlying = underlying
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        vectors = self._get_vectors(keys)
+
+        # Only embed the texts missing from the cache, in a single call
+        missing = [i for i, key in enumerate(keys) if key not in vectors]
+        if missing:
+            new_vectors = self.underlying.embed_documents([texts[i] for i in missing])
+            new_entries = {keys[i]: self._to_float32(vector) for i, vector in zip(missing, new_vectors)}
+            self._set_vectors(new_entries)
+            vectors.update(new_entries)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self._key("query:" + text)
+        vectors = self._get_vectors([key])
+        if key not in vectors:
+            vectors[key] = self._to_float32(self.underlying.embed_query(text))
+            self._set_vectors({key: vectors[key]})
+        return vectors[key]
+
+    @staticmethod
+    def _to_float32(vector):
+        # Vectors are stored as float32, return the same values whether cached or not
+        return np.asarray(vector, dtype=np.float32).tolist()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.namespace}:{text}".encode("utf-8")).hexdigest()
+
+    def _get_vectors(self, keys):
+        vectors = {}
+        with self._lock:
+            # stay below SQLite's maximum number of query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vectors[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return vectors
+
+    def _set_vectors(self, vectors):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in vectors.items()
+                ]
+            )
+
+
+def get_embeddings(backend="google", model=None, cache_path="embeddings_cache.db"):
+    """
+    Creates the embeddings model used for indexing and retrieval.
+
+    @param backend: "google" for the Gemini embedding API or "local" for a CPU model (fastembed)
+    @param model: Embedding model name, defaults to the backend's default model
+    @param cache_path: SQLite file caching the computed vectors, empty to disable the cache
+    @return: Embeddings instance
+    """
+    model = model or DEFAULT_MODELS[backend]
+    if backend == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        embeddings = GoogleGenerativeAIEmbeddings(model=model)
+    elif backend == "local":
+        try:
+            from langchain_community.embeddings import FastEmbedEmbeddings
+            embeddings = FastEmbedEmbeddings(model_name=model)
+        except ImportError as error:
+            raise ImportError(
+                "The local embedding backend requires fastembed, install it with `pip install fastembed`"
+            ) from error
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    if cache_path:
+        embeddings = CachedEmbeddings(embeddings, cache_path, namespace=f"{backend}:{model}")
+    return embeddings
@@ -1,69 +1,194 @@
+import asyncio
+import logging
 from langgraph.graph import END, StateGraph
-from .state import GraphState
+from .state import GraphState, EmailState
 from .nodes import Nodes
+from .config import WorkflowConfig
+from .checkpointer import ThreadedSqliteSaver
+from .metrics import instrument_node, track_email
+
+logger = logging.getLogger(__name__)
+
+
+def add_node(graph: StateGraph, name, node):
+    """Adds a node to the graph, recording its wall time in the metrics."""
+    graph.add_node(name, instrument_node(name, node))
+
 
 class Workflow():
-    def __init__(self):
-        # initiate graph state & nodes
+    def __init__(self, config: WorkflowConfig = None, nodes: Nodes = None):
+        # initiate config & nodes
+        self.config = config or WorkflowConfig.from_env()
+        nodes = nodes or Nodes(self.config)
+        self.nodes = nodes
+
+        # Checkpoint every email run so a crashed run resumes from its last completed node
+        self.checkpointer = None
+        if self.config.checkpoint_db_path:
+            self.checkpointer = ThreadedSqliteSaver.from_path(self.config.checkpoint_db_path)
+        self.email_app = self._build_email_graph(nodes, create_draft=True).compile(checkpointer=self.checkpointer)
+
+        # Same email graph returning the approved reply for emails submitted through the API:
+        # no Gmail draft, thread context nor ledger entry
+        self.reply_nodes = nodes.without_gmail()
+        self.reply_app = self._build_email_graph(self.reply_nodes, create_draft=False).compile()
+
+        # Inbox graph: load emails then fan them out to the email subgraph
         workflow = StateGraph(GraphState)
-        nodes = Nodes()
-
-        # define all graph nodes
-        workflow.add_node("load_inbox_emails", nodes.load_new_emails)
-        workflow.add_node("is_email_inbox_empty", nodes.is_email_inbox_empty)
-        workflow.add_node("categorize_email", nodes.categorize_email)
-        workflow.add_node("construct_rag_queries", nodes.construct_rag_queries)
-        workflow.add_node("retrieve_from_rag", nodes.retrieve_from_rag)
-        workflow.add_node("email_writer", nodes.write_draft_email)
-        workflow.add_node("email_proofreader", nodes.verify_generated_email)
-        workflow.add_node("send_email", nodes.create_draft_response)
-        workflow.add_node("skip_unrelated_email", nodes.skip_unrelated_email)
+        add_node(workflow, "load_inbox_emails", nodes.load_new_emails)
+        add_node(workflow, "process_email", self.process_email)
 
         # load inbox emails
         workflow.set_entry_point("load_inbox_emails")
+        dispatch_from = "load_inbox_emails"
 
-        # check if there are emails to process
-        workflow.add_edge("load_inbox_emails", "is_email_inbox_empty")
+        # optionally categorize & design queries for the whole inbox in batched LLM calls
+        if self.config.triage_mode == "batch":
+            add_node(workflow, "triage_inbox_emails", nodes.triage_inbox_emails)
+            workflow.add_edge("load_inbox_emails", "triage_inbox_emails")
+            dispatch_from = "triage_inbox_emails"
+
+        # process every new email concurrently (bounded by max_concurrency)
         workflow.add_conditional_edges(
-            "is_email_inbox_empty",
-            nodes.check_new_emails,
-            {
-                "process": "categorize_email",
-                "empty": END
-            }
+            dispatch_from,
+            nodes.dispatch_emails,
+            ["process_email", END]
         )
+        workflow.add_edge("process_email", END)
+
+        # Compile (nodes are async: run the graph with ainvoke/astream)
+        self.app = workflow.compile().with_config(
+            max_concurrency=self.config.max_concurrency
+        )
+
+    def _build_email_graph(self, nodes: Nodes, create_draft):
+        """Per-email subgraph: every email gets its own isolated state."""
+        email_workflow = StateGraph(EmailState)
+
+        # define all email graph nodes
+        add_node(email_workflow, "categorize_email", nodes.categorize_email)
+        add_node(email_workflow, "construct_rag_queries", nodes.construct_rag_queries)
+        add_node(email_workflow, "retrieve_from_rag", nodes.retrieve_from_rag)
+        add_node(email_workflow, "email_writer", nodes.write_draft_email)
+        add_node(email_workflow, "email_proofreader", nodes.verify_generated_email)
+        add_node(email_workflow, "skip_unrelated_email", nodes.skip_unrelated_email)
+        add_node(email_workflow, "reject_email", nodes.reject_email)
+        # the writer gets the earlier messages of the thread first (if enabled)
+        writer_entry = "email_writer"
+        if self.config.thread_context and nodes.use_gmail:
+            add_node(email_workflow, "build_thread_context", nodes.build_thread_context)
+            email_workflow.add_edge("build_thread_context", "email_writer")
+            writer_entry = "build_thread_context"
+        if create_draft:
+            add_node(email_workflow, "send_email", nodes.create_draft_response)
+
+        # start by categorizing the email
+        email_workflow.set_entry_point("categorize_email")
 
         # route email based on category
-        workflow.add_conditional_edges(
+        email_workflow.add_conditional_edges(
             "categorize_email",
             nodes.route_email_based_on_category,
             {
                 "product related": "construct_rag_queries",
-                "not product related": "email_writer", # Feedback or Complaint
+                "not product related": writer_entry, # Feedback or Complaint
                 "unrelated": "skip_unrelated_email"
             }
         )
 
         # pass constructed queries to RAG chain to retrieve information
-        workflow.add_edge("construct_rag_queries", "retrieve_from_rag")
+        email_workflow.add_edge("construct_rag_queries", "retrieve_from_rag")
         # give information to writer agent to create draft email
-        workflow.add_edge("retrieve_from_rag", "email_writer")
+        email_workflow.add_edge("retrieve_from_rag", writer_entry)
         # proofread the generated draft email
-        workflow.add_edge("email_writer", "email_proofreader")
+        email_workflow.add_edge("email_writer", "email_proofreader")
         # check if email is sendable or not, if not rewrite the email
-        workflow.add_conditional_edges(
+        email_workflow.add_conditional_edges(
             "email_proofreader",
             nodes.must_rewrite,
             {
-                "send": "send_email",
+                "send": "send_email" if create_draft else END,
                 "rewrite": "email_writer",
-                "stop": "categorize_email"
+                "stop": "reject_email"
             }
         )
 
-        # check if there are still emails to be processed
-        workflow.add_edge("send_email", "is_email_inbox_empty")
-        workflow.add_edge("skip_unrelated_email", "is_email_inbox_empty" )
+        # email is done once it is sent, skipped or rejected
+        if create_draft:
+            email_workflow.add_edge("send_email", END)
+        email_workflow.add_edge("skip_unrelated_email", END)
+        email_workflow.add_edge("reject_email", END)
+        return email_workflow
+
+    async def process_email(self, state: EmailState):
+        """
+        Inbox graph node running the email subgraph (see run_email). A failed email is logged
+        and keeps its checkpoint for `--resume`, the other emails of the fan-out go on.
+        """
+        try:
+            await self.run_email(state)
+        except Exception as error:
+            logger.error(f"Processing email {state['current_email'].id} failed: {error}")
+        return {}
+
+    async def run_email(self, state: EmailState):
+        """
+        Runs the email subgraph, resuming it from its checkpoint if a previous run was interrupted.
+        Its metrics are logged as one JSON line once the email is done. Errors are raised, so the
+        daemon & push workers can retry the email.
+        """
+        email_id = state["current_email"].id
+        with track_email(email_id) as record:
+            if self.checkpointer is None:
+                record.finish(await self.email_app.ainvoke(state))
+                return
+
+            config = self._email_thread_config(email_id)
+            if (await self.email_app.aget_state(config)).next:
+                logger.info(f"Resuming email {email_id} from checkpoint...")
+                record.finish(await self.email_app.ainvoke(None, config))
+            else:
+                record.finish(await self.email_app.ainvoke(state, config))
+
+        # The email is done, its checkpoints are no longer needed
+        await self.checkpointer.adelete_thread(config["configurable"]["thread_id"])
+
+    async def resume(self):
+        """
+        Resumes the email runs left unfinished by a crashed or interrupted run,
+        without fetching the inbox again.
+
+        @return: Number of resumed emails
+        """
+        if self.checkpointer is None:
+            return 0
+
+        # Checkpoint tables are created by SqliteSaver.setup()
+        with self.checkpointer.cursor(transaction=False) as cursor:
+            cursor.execute("SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id LIKE 'email:%'")
+            thread_ids = [row[0] for row in cursor.fetchall()]
+
+        pending = []
+        for thread_id in thread_ids:
+            config = {"configurable": {"thread_id": thread_id}}
+            if (await self.email_app.aget_state(config)).next:
+                pending.append(config)
+            else:
+                await self.checkpointer.adelete_thread(thread_id)
+
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+
+        async def resume_email(config):
+            async with semaphore:
+                thread_id = config["configurable"]["thread_id"]
+                logger.info(f"Resuming {thread_id} from checkpoint...")
+                with track_email(thread_id.removeprefix("email:")) as record:
+                    record.finish(await self.email_app.ainvoke(None, config))
+                await self.checkpointer.adelete_thread(config["configurable"]["thread_id"])
+
+        await asyncio.gather(*(resume_email(config) for config in pending))
+        return len(pending)
 
-        # Compile
-        self.app = workflow.compile()
\ No newline at end of file
+    @staticmethod
+    def _email_thread_config(email_id):
+        return {"configurable": {"thread_id": f"email:{email_id}"}}
@@ -0,0 +1,212 @@
+import time
+import logging
+import random
+import asyncio
+import threading
+import statistics
+from collections import defaultdict, deque
+from typing import Any, Optional
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from .metrics import record_retry
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+RETRYABLE_ERROR_NAMES = ("RateLimit", "Timeout", "ResourceExhausted", "ServiceUnavailable")
+
+
+def is_retryable_error(error):
+    """Rate limits, timeouts and provider overloads are retried on another model."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code in RETRYABLE_STATUS_CODES:
+        return True
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(name in type(error).__name__ for name in RETRYABLE_ERROR_NAMES)
+
+
+def create_chat_model(spec, temperature=0.1, timeout=None):
+    """
+    Creates a chat model from a "provider:model" spec, e.g. "groq:llama-3.3-70b-versatile".
+
+    @param timeout: Request timeout of the provider client (seconds)
+    """
+    provider, model = spec.split(":", 1)
+    if provider == "groq":
+        from langchain_groq import ChatGroq
+        return ChatGroq(model_name=model, temperature=temperature, request_timeout=timeout)
+    if provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=model, temperature=temperature, timeout=timeout)
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+class ModelEndpoint:
+    def __init__(self, name, provider, model, rate_limiter):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.rate_limiter = rate_limiter
+        # time until which the model is skipped after a rate limit or timeout
+        self.cooldown_until = 0.0
+
+
+class LLMRouter:
+    """
+    Routes agent calls over a pool of chat models:
+    - each provider is rate limited with a token bucket,
+    - rate limits & timeouts (of the provider client, or of the router for async calls) put
+      the model in cooldown and fail over to the next model,
+      with jittered exponential backoff once every model failed,
+    - for each agent, the model with the lowest recent p50 latency is tried first.
+    """
+    def __init__(
+        self,
+        models,
+        requests_per_second=1.0,
+        max_rounds=3,
+        base_delay=1.0,
+        max_delay=30.0,
+        latency_window=20,
+        timeout=None
+    ):
+        """
+        @param models: List of (name, provider, chat model) tuples, in fallback order
+        @param requests_per_second: Token bucket refill rate of each provider
+        @param max_rounds: Number of passes over the whole pool before giving up
+        @param timeout: Seconds after which an async call fails over to the next model (None to wait)
+        """
+        if not models:
+            raise ValueError("The LLM pool is empty, set at least one model in LLM_MODELS")
+        if max_rounds < 1:
+            raise ValueError("LLM_MAX_ROUNDS must be at least 1")
+        rate_limiters = {}
+        self.endpoints = []
+        for name, provider, model in models:
+            if provider not in rate_limiters:
+                rate_limiters[provider] = InMemoryRateLimiter(
+                    requests_per_second=requests_per_second, check_every_n_seconds=0.05
+                )
+            self.endpoints.append(ModelEndpoint(name, provider, model, rate_limiters[provider]))
+        self.max_rounds = max_rounds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # (agent, model name) -> recent call latencies
+        self._latencies = defaultdict(lambda: deque(maxlen=latency_window))
+
+    @classmethod
+    def from_config(cls, config):
+        models = [
+            (spec, spec.split(":", 1)[0], create_chat_model(spec, timeout=config.llm_timeout))
+            for spec in config.llm_models
+        ]
+        return cls(
+            models,
+            requests_per_second=config.llm_requests_per_second,
+            max_rounds=config.llm_max_rounds,
+            timeout=config.llm_timeout
+        )
+
+    def chat(self):
+        """Runnable routing raw chat model calls."""
+        return RoutedModel(router=self, runnables={
+            endpoint.name: endpoint.model for endpoint in self.endpoints
+        })
+
+    def structured(self, schema):
+        """Runnable routing structured output calls returning the given schema."""
+        return RoutedModel(router=self, runnables={
+            endpoint.name: endpoint.model.with_structured_output(schema) for endpoint in self.endpoints
+        })
+
+    def rank(self, agent):
+        """Endpoints ordered for the agent: available first, then by lowest p50 latency."""
+        now = time.monotonic()
+        with self._lock:
+            def sort_key(item):
+                index, endpoint = item
+                latencies = self._latencies.get((agent, endpoint.name))
+                p50 = statistics.median(latencies) if latencies else float("inf")
+                return (endpoint.cooldown_until > now, p50, index)
+            return [endpoint for _, endpoint in sorted(enumerate(self.endpoints), key=sort_key)]
+
+    def record_success(self, agent, endpoint, latency):
+        with self._lock:
+            self._latencies[(agent, endpoint.name)].append(latency)
+
+    def record_failure(self, endpoint, round_index, error):
+        logger.warning(f"LLM {endpoint.name} failed ({type(error).__name__}), failing over...")
+        record_retry(endpoint.name, error)
+        with self._lock:
+            endpoint.cooldown_until = time.monotonic() + self.backoff_delay(round_index)
+
+    def backoff_delay(self, round_index):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** round_index))
+
+    def latency_stats(self):
+        with self._lock:
+            return {
+                f"{agent}/{model}": statistics.median(latencies)
+                for (agent, model), latencies in self._latencies.items() if latencies
+            }
+
+
+class RoutedModel(Runnable):
+    """Runnable calling one of the router models, see LLMRouter."""
+    def __init__(self, router: LLMRouter, runnables):
+        self.router = router
+        self.runnables = runnables
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        config = ensure_config(config)
+        agent = config.get("metadata", {}).get("agent", "default")
+        last_error = None
+        for round_index in range(self.router.max_rounds):
+            for endpoint in self.router.rank(agent):
+                endpoint.rate_limiter.acquire()
+                start = time.perf_counter()
+                try:
+                    result = self.runnables[endpoint.name].invoke(input, config, **kwargs)
+                except Exception as error:
+                    if not is_retryable_error(error):
+                        raise
+                    self.router.record_failure(endpoint, round_index, error)
+                    last_error = error
+                    continue
+                self.router.record_success(agent, endpoint, time.perf_counter() - start)
+                return result
+            # No wait after the last round, the error is raised right away
+            if round_index < self.router.max_rounds - 1:
+                time.sleep(self.router.backoff_delay(round_index))
+        raise last_error
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        config = ensure_config(config)
+        agent = config.get("metadata", {}).get("agent", "default")
+        last_error = None
+        for round_index in range(self.router.max_rounds):
+            for endpoint in self.router.rank(agent):
+                await endpoint.rate_limiter.aacquire()
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(
+                        self.runnables[endpoint.name].ainvoke(input, config, **kwargs), self.router.timeout
+                    )
+                except Exception as error:
+                    if not is_retryable_error(error):
+                        raise
+                    self.router.record_failure(endpoint, round_index, error)
+                    last_error = error
+                    continue
+                self.router.record_success(agent, endpoint, time.perf_counter() - start)
+                return result
+            if round_index < self.router.max_rounds - 1:
+                await asyncio.sleep(self.router.backoff_delay(round_index))
+        raise last_error
@@ -0,0 +1,63 @@
+import sys
+import json
+import logging
+from colorama import Fore, Style
+
+# Loggers of the application, other libraries only log warnings & errors
+APP_LOGGERS = ("src", "main", "email_metrics")
+
+LEVEL_COLORS = {
+    logging.DEBUG: Fore.MAGENTA,
+    logging.INFO: Fore.CYAN,
+    logging.WARNING: Fore.YELLOW,
+    logging.ERROR: Fore.RED,
+    logging.CRITICAL: Fore.RED,
+}
+
+
+class ColorFormatter(logging.Formatter):
+    """Human readable console logs, colored by level."""
+    def format(self, record):
+        message = super().format(record)
+        return LEVEL_COLORS.get(record.levelno, "") + message + Style.RESET_ALL
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log collectors."""
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name}
+        # Structured fields passed with `extra={"data": {...}}` replace the message
+        if isinstance(getattr(record, "data", None), dict):
+            entry.update(record.data)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def setup_logging(level="INFO", log_format="text", log_file=None):
+    """
+    Configures the application logs (entry points call it once at startup).
+
+    @param level: Minimum level of the application messages
+    @param log_format: "text" (colored console lines) or "json" (one JSON object per line)
+    @param log_file: Also write the logs to this file
+    """
+    if log_format == "json":
+        console_formatter = file_formatter = JsonFormatter()
+    else:
+        text_format = ("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S")
+        console_formatter = ColorFormatter(*text_format)
+        # Log files don't get the ANSI color codes
+        file_formatter = logging.Formatter(*text_format)
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(console_formatter)
+    handlers = [console]
+    if log_file:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(file_formatter)
+        handlers.append(file_handler)
+    logging.basicConfig(level=logging.WARNING, handlers=handlers, force=True)
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(level.upper())
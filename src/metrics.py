@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import defaultdict
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from langchain_core.callbacks import BaseCallbackHandler
+from .tokens import TokenUsageCallback
+
+email_logger = logging.getLogger("email_metrics")
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+NODE_SECONDS = Histogram(
+    "email_workflow_node_seconds", "Wall time of the graph nodes", ["node"], buckets=LATENCY_BUCKETS
+)
+AGENT_SECONDS = Histogram(
+    "email_workflow_agent_seconds", "Wall time of the agent chains", ["agent"], buckets=LATENCY_BUCKETS
+)
+LLM_CALLS = Counter("email_workflow_llm_calls", "LLM calls made by the agents", ["agent"])
+LLM_TOKENS = Counter("email_workflow_llm_tokens", "LLM tokens used by the agents", ["agent", "kind"])
+LLM_RETRIES = Counter(
+    "email_workflow_llm_retries", "Failed LLM calls retried on another model by the router", ["model", "error"]
+)
+CACHE_LOOKUPS = Counter("email_workflow_cache_lookups", "Semantic cache lookups", ["cache", "result"])
+GMAIL_CALLS = Counter("email_workflow_gmail_calls", "Gmail API requests", ["method", "status"])
+GMAIL_SECONDS = Histogram(
+    "email_workflow_gmail_seconds", "Latency of the Gmail API requests", ["method"], buckets=LATENCY_BUCKETS
+)
+GMAIL_WRITES = Counter(
+    "email_workflow_gmail_writes", "Replies written to Gmail by the outbound writer", ["action", "status"]
+)
+GMAIL_WRITE_SECONDS = Histogram(
+    "email_workflow_gmail_write_seconds", "Time from queueing a reply to its confirmed Gmail write (retries included)",
+    ["action"], buckets=LATENCY_BUCKETS
+)
+EMAILS_PROCESSED = Counter("email_workflow_emails", "Emails processed by the workflow", ["category", "outcome"])
+EMAIL_SECONDS = Histogram(
+    "email_workflow_email_seconds", "Wall time of the email workflow", buckets=LATENCY_BUCKETS
+)
+RESOURCE_INIT_SECONDS = Gauge(
+    "email_workflow_resource_init_seconds", "Time taken to create the shared resources", ["resource"],
+    multiprocess_mode="max"
+)
+
+
+class EmailRecord:
+    """Metrics of a single email workflow run, written as one JSON log line when it ends."""
+    def __init__(self, email_id):
+        self.email_id = email_id
+        self.started = time.perf_counter()
+        self.category = None
+        self.outcome = None
+        self.node_seconds = defaultdict(float)
+        self.llm_calls = 0
+        self.tokens = defaultdict(int)
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.gmail_calls = 0
+        # Nodes & agents of an email can run in worker threads
+        self._lock = threading.Lock()
+
+    def finish(self, state):
+        """Sets the category & outcome from the final state of the email subgraph."""
+        self.category = state.get("email_category")
+        if self.category == "unrelated":
+            self.outcome = "skipped"
+        elif state.get("sendable"):
+            self.outcome = "replied"
+        else:
+            self.outcome = "rejected"
+
+    def to_dict(self):
+        return {
+            "email_id": self.email_id,
+            "category": self.category,
+            "outcome": self.outcome,
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "nodes": {node: round(seconds, 3) for node, seconds in self.node_seconds.items()},
+            "llm_calls": self.llm_calls,
+            "tokens": dict(self.tokens),
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "gmail_calls": self.gmail_calls,
+        }
+
+
+# Email being processed, inherited by the tasks & threads started while processing it
+_current_email: ContextVar = ContextVar("current_email", default=None)
+
+
+def _update_email(update):
+    record = _current_email.get()
+    if record is not None:
+        with record._lock:
+            update(record)
+
+
+@contextmanager
+def track_email(email_id):
+    """
+    Collects the metrics of an email workflow run, and logs them as a JSON line at the end.
+
+    @param email_id: Id of the processed email
+    @return: The EmailRecord, call its finish method with the final email state
+    """
+    record = EmailRecord(email_id)
+    token = _current_email.set(record)
+    try:
+        yield record
+    except Exception:
+        record.outcome = "error"
+        raise
+    finally:
+        _current_email.reset(token)
+        EMAIL_SECONDS.observe(time.perf_counter() - record.started)
+        EMAILS_PROCESSED.labels(record.category or "unknown", record.outcome or "unknown").inc()
+        data = record.to_dict()
+        email_logger.info(json.dumps(data), extra={"data": data})
+
+
+def record_node(node, seconds):
+    NODE_SECONDS.labels(node).observe(seconds)
+    _update_email(lambda record: record.node_seconds.__setitem__(node, record.node_seconds[node] + seconds))
+
+
+def record_llm_call(agent, usage):
+    LLM_CALLS.labels(agent).inc()
+    for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.labels(agent, kind).inc(usage[kind])
+
+    def update(record):
+        record.llm_calls += 1
+        for kind, count in usage.items():
+            record.tokens[kind] += count
+    _update_email(update)
+
+
+def record_retry(model, error):
+    LLM_RETRIES.labels(model, type(error).__name__).inc()
+    _update_email(lambda record: setattr(record, "retries", record.retries + 1))
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+    if hit:
+        _update_email(lambda record: setattr(record, "cache_hits", record.cache_hits + 1))
+    else:
+        _update_email(lambda record: setattr(record, "cache_misses", record.cache_misses + 1))
+
+
+def record_gmail_call(method, seconds, error=None):
+    GMAIL_CALLS.labels(method, "error" if error else "ok").inc()
+    GMAIL_SECONDS.labels(method).observe(seconds)
+    _update_email(lambda record: setattr(record, "gmail_calls", record.gmail_calls + 1))
+
+
+def record_gmail_write(action, status, seconds=None):
+    """
+    @param action: "draft" or "send"
+    @param status: "ok", "duplicate" (already written), "retry" (quota error, retried) or "failed"
+    @param seconds: Write latency, for the confirmed writes
+    """
+    GMAIL_WRITES.labels(action, status).inc()
+    if seconds is not None:
+        GMAIL_WRITE_SECONDS.labels(action).observe(seconds)
+
+
+def instrument_node(name, func):
+    """Wraps a graph node (sync or async) to record its wall time."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_node(state):
+            start = time.perf_counter()
+            try:
+                return await func(state)
+            finally:
+                record_node(name, time.perf_counter() - start)
+        return async_node
+
+    @functools.wraps(func)
+    def node(state):
+        start = time.perf_counter()
+        try:
+            return func(state)
+        finally:
+            record_node(name, time.perf_counter() - start)
+    return node
+
+
+class AgentMetricsCallback(BaseCallbackHandler):
+    """Records the wall time and LLM calls of the agent chains tagged with an "agent" run metadata."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        # run id -> (agent, start time) of the agent chains in progress
+        self._chains = {}
+        # run id -> agent of the LLM runs in progress
+        self._llm_runs = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        agent = (metadata or {}).get("agent")
+        # Only the agent chain itself, not its prompt/model/parser steps
+        if agent and kwargs.get("name") == agent:
+            with self._lock:
+                self._chains[run_id] = (agent, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._record_chain(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._record_chain(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._register_llm_run(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._register_llm_run(run_id, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            agent = self._llm_runs.pop(run_id, "unknown")
+        record_llm_call(agent, TokenUsageCallback._get_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._llm_runs.pop(run_id, None)
+
+    def _register_llm_run(self, run_id, metadata):
+        with self._lock:
+            self._llm_runs[run_id] = (metadata or {}).get("agent", "unknown")
+
+    def _record_chain(self, run_id):
+        with self._lock:
+            chain = self._chains.pop(run_id, None)
+        if chain is not None:
+            agent, started_at = chain
+            AGENT_SECONDS.labels(agent).observe(time.perf_counter() - started_at)
+
+
+def render_metrics():
+    """
+    Renders the Prometheus metrics, merged across the workers of the process
+    when PROMETHEUS_MULTIPROC_DIR is set (gunicorn).
+
+    @return: Tuple of (metrics body, content type)
+    """
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
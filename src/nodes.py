@@ -1,50 +1,315 @@
-from colorama import Fore, Style
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langgraph.graph import END
+from langgraph.types import Send
 from .agents import Agents
-from .tools.GmailTools import GmailToolsClass
-from .state import GraphState, Email
+from .tools.SyncStore import CATEGORIZED, SKIPPED, REJECTED
+from .state import GraphState, EmailState, Email
+from .config import WorkflowConfig
+from .cache import SemanticCache
+from .classifier import EmailPreClassifier
+from .thread_context import ThreadContextBuilder
+from .outbound import OutboundWriter
+from .resources import shared_agents, shared_gmail_tools
+from .tokens import estimate_tokens
+from .prompts import EMAIL_WRITER_PROMPT, EMAIL_PROOFREADER_PROMPT
+
+logger = logging.getLogger(__name__)
 
 
 class Nodes:
-    def __init__(self):
-        self.agents = Agents()
-        self.gmail_tools = GmailToolsClass()
+    def __init__(self, config: WorkflowConfig = None, agents: Agents = None, gmail_tools=None, use_gmail=True):
+        self.config = config or WorkflowConfig.from_env()
+        # Emails not coming from the inbox (API) never touch Gmail nor the thread ledger
+        self.use_gmail = use_gmail
+        # LLM clients, vector store & Gmail client are created on first use (see warm_up)
+        # and shared by the process, unless given
+        self._agents = agents
+        self._gmail_tools = gmail_tools
+        self._rag_cache = None
+        self._draft_cache = None
+        self._thread_context_builder = None
+        self._outbound_writer = None
+        self._lock = threading.Lock()
+        self._ready = False
+
+        self.pre_classifier = None
+        if self.config.pre_classifier:
+            self.pre_classifier = EmailPreClassifier(self.config.pre_classifier_model_path)
+
+    @property
+    def agents(self) -> Agents:
+        if self._agents is None:
+            self._agents = shared_agents(self.config)
+        return self._agents
+
+    @property
+    def token_usage(self):
+        """LLM token usage per agent, None if the agents were never created (no LLM call made)."""
+        return self._agents.token_usage if self._agents is not None else None
+
+    @property
+    def gmail_tools(self):
+        if self._gmail_tools is None:
+            self._gmail_tools = shared_gmail_tools(self.config)
+        return self._gmail_tools
+
+    @property
+    def thread_context_builder(self) -> ThreadContextBuilder:
+        if self._thread_context_builder is None:
+            self._thread_context_builder = ThreadContextBuilder(
+                self.gmail_tools,
+                self.agents.summarize_thread,
+                token_budget=self.config.thread_context_token_budget,
+                summarizer_input_tokens=self.config.llm_context_window // 2
+            )
+        return self._thread_context_builder
+
+    @property
+    def outbound_writer(self) -> OutboundWriter:
+        if self._outbound_writer is None:
+            self._outbound_writer = OutboundWriter(
+                self.gmail_tools,
+                batch_size=self.config.write_batch_size,
+                flush_seconds=self.config.write_flush_seconds,
+                max_attempts=self.config.write_max_attempts
+            )
+        return self._outbound_writer
+
+    # Response caches for RAG answers and first drafts (None when disabled)
+    @property
+    def rag_cache(self):
+        self._create_caches()
+        return self._rag_cache
+
+    @property
+    def draft_cache(self):
+        self._create_caches()
+        return self._draft_cache
 
-    def load_new_emails(self, state: GraphState) -> GraphState:
+    def _create_caches(self):
+        if self.config.response_cache and self._rag_cache is None:
+            with self._lock:
+                if self._rag_cache is None:
+                    self._draft_cache = self._create_cache("draft", self.config.draft_cache_similarity_threshold)
+                    self._rag_cache = self._create_cache("rag", self.config.cache_similarity_threshold)
+
+    def without_gmail(self):
+        """Nodes sharing the same agents, for emails submitted through the API instead of the inbox."""
+        return Nodes(self.config, agents=self._agents, use_gmail=False)
+
+    def warm_up(self):
+        """Creates the agents (LLM clients, embeddings, vector store) and the Gmail client in parallel."""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            agents = executor.submit(lambda: self.agents)
+            if self.use_gmail:
+                executor.submit(lambda: self.gmail_tools).result()
+            agents.result()
+        self._create_caches()
+        self._ready = True
+
+    async def ensure_ready(self):
+        """Runs warm_up in a worker thread the first time, creating the clients never blocks the event loop."""
+        if not self._ready:
+            await asyncio.to_thread(self.warm_up)
+
+    def _create_cache(self, name, similarity_threshold):
+        return SemanticCache(
+            name=name,
+            embeddings=self.agents.embeddings,
+            similarity_threshold=similarity_threshold,
+            ttl_seconds=self.config.cache_ttl_seconds,
+            max_size=self.config.cache_max_size,
+            index_path=os.path.join(self.config.vectorstore_dir, "chroma.sqlite3")
+        )
+
+    def _agent_config(self, email: Email, **kwargs):
+        """Run config tagging agent calls with the email id, used for per-email token accounting."""
+        return {"metadata": {"email_id": email.id}, **kwargs}
+
+    async def load_new_emails(self, state: GraphState) -> GraphState:
         """Loads new emails from Gmail and updates the state."""
-        print(Fore.YELLOW + "Loading new emails...\n" + Style.RESET_ALL)
-        recent_emails = self.gmail_tools.fetch_unanswered_emails()
+        await self.ensure_ready()
+        logger.info("Loading new emails...")
+        recent_emails = await asyncio.to_thread(self.gmail_tools.fetch_unanswered_emails)
         emails = [Email(**email) for email in recent_emails]
         return {"emails": emails}
 
-    def check_new_emails(self, state: GraphState) -> str:
-        """Checks if there are new emails to process."""
+    def dispatch_emails(self, state: GraphState):
+        """Fans out every loaded email to its own email processing subgraph."""
         if len(state['emails']) == 0:
-            print(Fore.RED + "No new emails" + Style.RESET_ALL)
-            return "empty"
+            logger.info("No new emails")
+            return END
         else:
-            print(Fore.GREEN + "New emails to process" + Style.RESET_ALL)
-            return "process"
-        
-    def is_email_inbox_empty(self, state: GraphState) -> GraphState:
-        return state
+            logger.info(f"{len(state['emails'])} new emails to process")
+            # Results of the batch triage (if any) are passed to each email subgraph
+            categories = state.get("email_categories") or {}
+            rag_queries = state.get("email_rag_queries") or {}
+            sends = []
+            for email in state["emails"]:
+                email_state = {"current_email": email}
+                if email.id in categories:
+                    email_state["email_category"] = categories[email.id]
+                if email.id in rag_queries:
+                    email_state["rag_queries"] = rag_queries[email.id]
+                sends.append(Send("process_email", email_state))
+            return sends
+
+    async def triage_inbox_emails(self, state: GraphState) -> GraphState:
+        """Categorizes all inbox emails and designs the RAG queries of product enquiries in batched LLM calls."""
+        await self.ensure_ready()
+        logger.info("Triaging inbox emails in batches...")
+        emails = state["emails"]
 
-    def categorize_email(self, state: GraphState) -> GraphState:
+        # Obvious emails are categorized locally, the others in batched LLM calls
+        categories = {}
+        remaining_emails = []
+        for email in emails:
+            category = self._pre_classify(email)
+            if category is not None:
+                categories[email.id] = category.value
+            else:
+                remaining_emails.append(email)
+        async def categorize(email):
+            result = await self.agents.categorize_email.ainvoke(
+                {"email": email.body}, config=self._agent_config(email)
+            )
+            return result.category.value
+
+        categories.update(await self._run_batched(
+            remaining_emails,
+            self.agents.batch_categorize_emails,
+            lambda item: item.category.value,
+            categorize
+        ))
+        await self._record_threads([email for email in emails if email.id in categories], CATEGORIZED, categories)
+
+        # Design RAG queries of all product enquiries
+        enquiries = [email for email in emails if categories.get(email.id) == "product_enquiry"]
+        async def design_queries(email):
+            result = await self.agents.design_rag_queries.ainvoke(
+                {"email": email.body}, config=self._agent_config(email)
+            )
+            return result.queries
+
+        rag_queries = await self._run_batched(
+            enquiries,
+            self.agents.batch_design_rag_queries,
+            lambda item: item.queries,
+            design_queries
+        )
+
+        return {"email_categories": categories, "email_rag_queries": rag_queries}
+
+    async def _run_batched(self, emails, batch_agent, get_value, fallback):
+        """
+        Runs a batch agent over emails split into chunks fitting the LLM context window,
+        chunks are processed concurrently. Emails missing from a batch output (or whose
+        chunk failed to parse) fall back to a single-email call.
+
+        @return: Dictionary mapping each email id to its value, emails whose single call failed too
+                 are left out (their email subgraph categorizes them & designs their queries itself)
+        """
+        if not emails:
+            return {}
+
+        chunks = self._chunk_emails(emails)
+        outputs = await batch_agent.abatch(
+            [{"emails": self._format_batch_emails(chunk)} for chunk in chunks],
+            config={"max_concurrency": self.config.max_concurrency},
+            return_exceptions=True
+        )
+
+        results = {}
+        for chunk, output in zip(chunks, outputs):
+            if output is None or isinstance(output, Exception):
+                logger.warning(f"Batch call failed for {len(chunk)} emails: {output}")
+                continue
+            chunk_ids = {email.id for email in chunk}
+            for item in output.items:
+                if item.email_id in chunk_ids:
+                    results[item.email_id] = get_value(item)
+
+        missing = [email for email in emails if email.id not in results]
+        if missing:
+            logger.warning(f"Falling back to single calls for {len(missing)} emails")
+        fallback_values = await asyncio.gather(*(fallback(email) for email in missing), return_exceptions=True)
+        for email, value in zip(missing, fallback_values):
+            if isinstance(value, Exception):
+                logger.warning(f"Single call failed for email {email.id}: {value}")
+                continue
+            results[email.id] = value
+        return results
+
+    def _chunk_emails(self, emails):
+        """Splits emails into chunks fitting in half of the LLM context window (the rest is left for the prompt & output)."""
+        token_budget = self.config.llm_context_window // 2
+        chunks, chunk, chunk_tokens = [], [], 0
+        for email in emails:
+            email_tokens = estimate_tokens(self._format_batch_emails([email]))
+            if chunk and (chunk_tokens + email_tokens > token_budget or len(chunk) >= self.config.batch_max_emails):
+                chunks.append(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(email)
+            chunk_tokens += email_tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _format_batch_emails(self, emails):
+        return "\n\n".join(
+            f"## **EMAIL ID:** {email.id}\n{email.body}" for email in emails
+        )
+
+    def _pre_classify(self, email):
+        """Returns the pre-classifier category if it is confident enough, None otherwise."""
+        if not self.pre_classifier:
+            return None
+        category, confidence = self.pre_classifier.predict(email)
+        if category is not None and confidence >= self.config.pre_classifier_threshold:
+            logger.info(f"Pre-classified email (confidence {confidence:.2f})")
+            return category
+        return None
+
+    async def categorize_email(self, state: EmailState) -> EmailState:
         """Categorizes the current email using the categorize_email agent."""
-        print(Fore.YELLOW + "Checking email category...\n" + Style.RESET_ALL)
+        # First node of the email graph
+        await self.ensure_ready()
+        # Already categorized by the inbox batch triage
+        if state.get("email_category"):
+            return {}
+
+        logger.info("Checking email category...")
         
-        # Get the last email
-        current_email = state["emails"][-1]
-        result = self.agents.categorize_email.invoke({"email": current_email.body})
-        print(Fore.MAGENTA + f"Email category: {result.category.value}" + Style.RESET_ALL)
+        current_email = state["current_email"]
+
+        # Obvious emails are categorized locally, the LLM only handles uncertain ones
+        rag_queries = []
+        category = self._pre_classify(current_email)
+        if category is None and self.config.triage_mode == "fused":
+            # Category and RAG queries from a single LLM call
+            result = await self.agents.triage_email.ainvoke(
+                {"email": current_email.body}, config=self._agent_config(current_email)
+            )
+            category = result.category
+            if category.value == "product_enquiry":
+                rag_queries = result.queries
+        elif category is None:
+            result = await self.agents.categorize_email.ainvoke(
+                {"email": current_email.body}, config=self._agent_config(current_email)
+            )
+            category = result.category
+        logger.info(f"Email category: {category.value}")
+        await self._record_threads([current_email], CATEGORIZED, {current_email.id: category.value})
         
-        return {
-            "email_category": result.category.value,
-            "current_email": current_email
-        }
+        return {"email_category": category.value, "rag_queries": rag_queries}
 
-    def route_email_based_on_category(self, state: GraphState) -> str:
+    def route_email_based_on_category(self, state: EmailState) -> str:
         """Routes the email based on its category."""
-        print(Fore.YELLOW + "Routing email based on category...\n" + Style.RESET_ALL)
+        logger.info("Routing email based on category...")
         category = state["email_category"]
         if category == "product_enquiry":
             return "product related"
@@ -53,104 +318,266 @@ class Nodes:
         else:
             return "not product related"
 
-    def construct_rag_queries(self, state: GraphState) -> GraphState:
+    async def construct_rag_queries(self, state: EmailState) -> EmailState:
         """Constructs RAG queries based on the email content."""
-        print(Fore.YELLOW + "Designing RAG query...\n" + Style.RESET_ALL)
+        # Already designed by the fused or batch triage
+        if state.get("rag_queries"):
+            return {}
+
+        logger.info("Designing RAG query...")
         email_content = state["current_email"].body
-        query_result = self.agents.design_rag_queries.invoke({"email": email_content})
+        query_result = await self.agents.design_rag_queries.ainvoke(
+            {"email": email_content}, config=self._agent_config(state["current_email"])
+        )
         
         return {"rag_queries": query_result.queries}
 
-    def retrieve_from_rag(self, state: GraphState) -> GraphState:
+    async def retrieve_from_rag(self, state: EmailState) -> EmailState:
         """Retrieves information from internal knowledge based on RAG questions."""
-        print(Fore.YELLOW + "Retrieving information from internal knowledge...\n" + Style.RESET_ALL)
+        logger.info("Retrieving information from internal knowledge...")
+        queries = state["rag_queries"]
+        batch_config = self._agent_config(
+            state["current_email"], max_concurrency=self.config.rag_max_concurrency
+        )
+
+        if self.config.rag_mode == "merged":
+            questions = "\n".join(f"{i}. {query}" for i, query in enumerate(queries, 1))
+            final_answer = await asyncio.to_thread(self.rag_cache.lookup, questions) if self.rag_cache else None
+            if final_answer is not None:
+                logger.info("RAG answers found in cache")
+                return {"retrieved_documents": final_answer}
+
+            # Retrieve context for every query, then answer all of them in one LLM call
+            docs_per_query = await self.agents.retriever.abatch(queries, config=batch_config)
+            context = self._merge_documents(docs_per_query)
+            final_answer = await self.agents.generate_rag_answers.ainvoke({
+                "questions": questions,
+                "context": context
+            }, config=batch_config)
+            if self.rag_cache:
+                await asyncio.to_thread(self.rag_cache.store, questions, final_answer)
+            return {"retrieved_documents": final_answer}
+
+        # Reuse cached answers, only the missing queries go through the RAG chain
+        rag_results = [None] * len(queries)
+        vectors = [None] * len(queries)
+        if self.rag_cache:
+            vectors = await asyncio.to_thread(self.rag_cache.embed, queries)
+            rag_results = [
+                await asyncio.to_thread(self.rag_cache.lookup, query, vector)
+                for query, vector in zip(queries, vectors)
+            ]
+            cache_hits = len(queries) - rag_results.count(None)
+            if cache_hits:
+                logger.info(f"{cache_hits} RAG answers found in cache")
+
+        # Answer queries concurrently, batch keeps the results in the queries order
+        missing = [i for i, result in enumerate(rag_results) if result is None]
+        if missing:
+            answers = await self.agents.generate_rag_answer.abatch(
+                [queries[i] for i in missing], config=batch_config
+            )
+            for i, answer in zip(missing, answers):
+                rag_results[i] = answer
+                if self.rag_cache:
+                    await asyncio.to_thread(self.rag_cache.store, queries[i], answer, vectors[i])
+
         final_answer = ""
-        for query in state["rag_queries"]:
-            rag_result = self.agents.generate_rag_answer.invoke(query)
+        for query, rag_result in zip(queries, rag_results):
             final_answer += query + "\n" + rag_result + "\n\n"
         
         return {"retrieved_documents": final_answer}
 
-    def write_draft_email(self, state: GraphState) -> GraphState:
+    def _merge_documents(self, docs_per_query):
+        """Merges the documents retrieved for several queries, dropping duplicates."""
+        seen = set()
+        contents = []
+        for docs in docs_per_query:
+            for doc in docs:
+                if doc.page_content not in seen:
+                    seen.add(doc.page_content)
+                    contents.append(doc.page_content)
+        return "\n\n".join(contents)
+
+    async def build_thread_context(self, state: EmailState) -> EmailState:
+        """Gives the writer the earlier messages of the email thread, summarized beyond the token budget."""
+        # Built once, rewrites reuse it
+        if state.get("thread_context") is not None:
+            return {}
+
+        current_email = state["current_email"]
+        try:
+            thread_context = await self.thread_context_builder.build(
+                current_email, self._agent_config(current_email)
+            )
+        except Exception as error:
+            # The reply can still be written from the email alone
+            logger.warning(f"Could not build the thread context: {error}")
+            thread_context = ""
+        return {"thread_context": thread_context}
+
+    async def write_draft_email(self, state: EmailState) -> EmailState:
         """Writes a draft email based on the current email and retrieved information."""
-        print(Fore.YELLOW + "Writing draft email...\n" + Style.RESET_ALL)
+        logger.info("Writing draft email...")
         
         # Format input to the writer agent
-        inputs = (
-            f'# **EMAIL CATEGORY:** {state["email_category"]}\n\n'
-            f'# **EMAIL CONTENT:**\n{state["current_email"].body}\n\n'
-            f'# **INFORMATION:**\n{state["retrieved_documents"]}' # Empty for feedback or complaint
-        )
+        inputs = self._format_writer_inputs(state)
         
         # Get messages history for current email
         writer_messages = state.get('writer_messages', [])
-        
+
+        # First draft can reuse the approved reply of an identical email
+        email = None
+        prompt_tokens = 0
+        if self.draft_cache and not writer_messages:
+            email = await asyncio.to_thread(self.draft_cache.lookup, inputs)
+            if email is not None:
+                logger.info("Draft email found in cache")
+
         # Write email
-        draft_result = self.agents.email_writer.invoke({
-            "email_information": inputs,
-            "history": writer_messages
-        })
-        email = draft_result.email
-        trials = state.get('trials', 0) + 1
+        if email is None:
+            # Rewrites only need the previous draft and the proofreader feedback
+            history = writer_messages
+            if self.config.writer_history_mode == "incremental":
+                history = writer_messages[-2:]
+            writer_inputs, history = self._fit_writer_budget(state, history)
+            prompt_tokens = estimate_tokens(EMAIL_WRITER_PROMPT + writer_inputs + "".join(history))
 
-        # Append writer's draft to the message list
-        writer_messages.append(f"**Draft {trials}:**\n{email}")
+            draft_result = await self.agents.email_writer.ainvoke({
+                "email_information": writer_inputs,
+                "history": history
+            }, config=self._agent_config(state["current_email"]))
+            email = draft_result.email
+        trials = state.get('trials', 0) + 1
 
         return {
             "generated_email": email, 
             "trials": trials,
-            "writer_messages": writer_messages
+            # Append writer's draft to the message list
+            "writer_messages": writer_messages + [f"**Draft {trials}:**\n{email}"],
+            "prompt_tokens": state.get("prompt_tokens", 0) + prompt_tokens
         }
 
-    def verify_generated_email(self, state: GraphState) -> GraphState:
+    def _format_writer_inputs(self, state: EmailState, retrieved_documents=None) -> str:
+        if retrieved_documents is None:
+            retrieved_documents = state.get("retrieved_documents", "")
+        thread_context = ""
+        if state.get("thread_context"):
+            thread_context = f'# **PREVIOUS MESSAGES OF THE THREAD:**\n{state["thread_context"]}\n\n'
+        return (
+            f'# **EMAIL CATEGORY:** {state["email_category"]}\n\n'
+            f'{thread_context}'
+            f'# **EMAIL CONTENT:**\n{state["current_email"].body}\n\n'
+            f'# **INFORMATION:**\n{retrieved_documents}' # Empty for feedback or complaint
+        )
+
+    def _fit_writer_budget(self, state: EmailState, history):
+        """
+        Keeps the writer prompt under the token budget: the oldest history messages
+        are dropped first (the last draft & feedback are kept), then the retrieved
+        information is truncated.
+
+        @return: Tuple of (writer inputs, history)
+        """
+        budget = self.config.writer_token_budget - estimate_tokens(EMAIL_WRITER_PROMPT)
+        history = list(history)
+        inputs = self._format_writer_inputs(state)
+
+        def prompt_size():
+            return estimate_tokens(inputs) + estimate_tokens("".join(history))
+
+        while len(history) > 2 and prompt_size() > budget:
+            history.pop(0)
+
+        overflow = prompt_size() - budget
+        if overflow > 0:
+            documents = state.get("retrieved_documents", "")
+            kept_chars = max(0, len(documents) - overflow * 4)
+            inputs = self._format_writer_inputs(state, documents[:kept_chars])
+        return inputs, history
+
+    async def verify_generated_email(self, state: EmailState) -> EmailState:
         """Verifies the generated email using the proofreader agent."""
-        print(Fore.YELLOW + "Verifying generated email...\n" + Style.RESET_ALL)
-        review = self.agents.email_proofreader.invoke({
+        logger.info("Verifying generated email...")
+        review = await self.agents.email_proofreader.ainvoke({
             "initial_email": state["current_email"].body,
             "generated_email": state["generated_email"],
-        })
+        }, config=self._agent_config(state["current_email"]))
+        prompt_tokens = state.get("prompt_tokens", 0) + estimate_tokens(
+            EMAIL_PROOFREADER_PROMPT + state["current_email"].body + state["generated_email"]
+        )
+        logger.info(f"Prompt tokens used for this email: ~{prompt_tokens}")
 
         writer_messages = state.get('writer_messages', [])
-        writer_messages.append(f"**Proofreader Feedback:**\n{review.feedback}")
 
         return {
             "sendable": review.send,
-            "writer_messages": writer_messages
+            "writer_messages": writer_messages + [f"**Proofreader Feedback:**\n{review.feedback}"],
+            "prompt_tokens": prompt_tokens
         }
 
-    def must_rewrite(self, state: GraphState) -> str:
+    def must_rewrite(self, state: EmailState) -> str:
         """Determines if the email needs to be rewritten based on the review and trial count."""
         email_sendable = state["sendable"]
         if email_sendable:
-            print(Fore.GREEN + "Email is good, ready to be sent!!!" + Style.RESET_ALL)
-            state["emails"].pop()
-            state["writer_messages"] = []
+            logger.info("Email is good, ready to be sent!!!")
             return "send"
         elif state["trials"] >= 3:
-            print(Fore.RED + "Email is not good, we reached max trials must stop!!!" + Style.RESET_ALL)
-            state["emails"].pop()
-            state["writer_messages"] = []
+            logger.warning("Email is not good, we reached max trials must stop!!!")
             return "stop"
         else:
-            print(Fore.RED + "Email is not good, must rewrite it..." + Style.RESET_ALL)
+            logger.info("Email is not good, must rewrite it...")
             return "rewrite"
 
-    def create_draft_response(self, state: GraphState) -> GraphState:
+    async def create_draft_response(self, state: EmailState) -> EmailState:
         """Creates a draft response in Gmail."""
-        print(Fore.YELLOW + "Creating draft email...\n" + Style.RESET_ALL)
-        self.gmail_tools.create_draft_reply(state["current_email"], state["generated_email"])
+        logger.info("Creating draft email...")
+        # Written in a batch with the drafts of the other emails, a failed write fails the email
+        # (retried from its checkpoint, the idempotency key prevents duplicate drafts)
+        await self.outbound_writer.write(state["current_email"], state["generated_email"])
+        await self._cache_approved_draft(state)
         
-        return {"retrieved_documents": "", "trials": 0}
+        return {}
 
-    def send_email_response(self, state: GraphState) -> GraphState:
+    async def send_email_response(self, state: EmailState) -> EmailState:
         """Sends the email response directly using Gmail."""
-        print(Fore.YELLOW + "Sending email...\n" + Style.RESET_ALL)
-        self.gmail_tools.send_reply(state["current_email"], state["generated_email"])
+        logger.info("Sending email...")
+        await self.outbound_writer.write(state["current_email"], state["generated_email"], send=True)
+        await self._cache_approved_draft(state)
         
-        return {"retrieved_documents": "", "trials": 0}
+        return {}
+
+    async def _cache_approved_draft(self, state: EmailState):
+        """Only replies approved by the proofreader are reused for identical emails."""
+        if self.draft_cache:
+            await asyncio.to_thread(
+                self.draft_cache.store, self._format_writer_inputs(state), state["generated_email"]
+            )
     
-    def skip_unrelated_email(self, state):
-        """Skip unrelated email and remove from emails list."""
-        print("Skipping unrelated email...\n")
-        state["emails"].pop()
-        return state
\ No newline at end of file
+    async def skip_unrelated_email(self, state: EmailState) -> EmailState:
+        """Skip unrelated email and record it in the ledger so it is not processed again."""
+        logger.info("Skipping unrelated email...")
+        await self._record_threads([state["current_email"]], SKIPPED)
+        return {}
+
+    async def reject_email(self, state: EmailState) -> EmailState:
+        """
+        Records the email rejected by the proofreader in the ledger, so it is not written
+        again on every run: a new message in the thread gets a new try.
+        """
+        logger.info("Giving up on email, every reply was rejected...")
+        await self._record_threads([state["current_email"]], REJECTED)
+        return {}
+
+    async def _record_threads(self, emails, status, categories=None):
+        """Records the new state of the email threads in the ledger (in a worker thread, inbox emails only)."""
+        if not self.use_gmail:
+            return
+        categories = categories or {}
+
+        def record():
+            for email in emails:
+                self.gmail_tools.sync_store.update_thread(
+                    email.threadId, email.id, status, category=categories.get(email.id)
+                )
+        await asyncio.to_thread(record)
\ No newline at end of file
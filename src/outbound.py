@@ -0,0 +1,210 @@
+import time
+import random
+import asyncio
+import logging
+import contextvars
+import httplib2
+from .state import Email
+from .metrics import record_gmail_write
+from .tools.SyncStore import DRAFTED, SENT, WRITE_PENDING, WRITE_REJECTED, WRITE_DONE, WRITE_FAILED
+
+logger = logging.getLogger(__name__)
+
+# Reasons of the Gmail 403 errors caused by quotas, retried like 429s
+QUOTA_ERROR_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "dailyLimitExceeded")
+
+
+class OutboundWriteError(Exception):
+    """A reply could not be written to Gmail."""
+
+
+def is_retryable_gmail_error(error):
+    """Quota errors, Gmail server errors and lost connections are retried with backoff."""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        # No answer from Gmail
+        return isinstance(error, (OSError, TimeoutError, httplib2.HttpLib2Error))
+    if status == 429 or status >= 500:
+        return True
+    if status == 403:
+        content = getattr(error, "content", b"") or b""
+        if isinstance(content, bytes):
+            content = content.decode("utf-8", errors="replace")
+        return any(reason in content for reason in QUOTA_ERROR_REASONS)
+    return False
+
+
+def idempotency_key(email: Email):
+    """A single reply is written for each message of a thread."""
+    return f"{email.threadId}:{email.id}"
+
+
+class PendingWrite:
+    def __init__(self, email: Email, reply_text, send, future):
+        self.key = idempotency_key(email)
+        self.email = email
+        self.reply_text = reply_text
+        self.send = send
+        self.action = "send" if send else "draft"
+        self.future = future
+        self.queued_at = time.perf_counter()
+        self.attempts = 0
+        self.available_at = 0.0
+
+
+class OutboundWriter:
+    """
+    Outbound stage of the workflow: the replies of the emails processed concurrently are queued
+    and written to Gmail together in batch requests. Quota errors are retried with backoff, and
+    every reply has an idempotency key (thread & answered message) recorded in the sync store so
+    retries & resumed runs never create a second draft or send a reply twice.
+    """
+    def __init__(self, gmail_tools, batch_size=50, flush_seconds=0.2, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        """
+        @param gmail_tools: GmailToolsClass writing the replies, its sync store keeps the idempotency keys
+        @param batch_size: Maximum number of replies written in one batch request
+        @param flush_seconds: Time waited for other replies before writing a batch
+        @param max_attempts: Attempts of a reply before it fails
+        """
+        self.gmail_tools = gmail_tools
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queue = []
+        self._flusher = None
+        self._loop = None
+
+    @property
+    def store(self):
+        return self.gmail_tools.sync_store
+
+    async def write(self, email: Email, reply_text, send=False):
+        """
+        Queues the reply and waits until it is written to Gmail.
+
+        @param email: Email answered by the reply
+        @param reply_text: Content of the reply
+        @param send: Send the reply instead of creating a draft
+        @return: Id of the draft or sent message
+        @raise OutboundWriteError: The reply could not be written
+        """
+        action = "send" if send else "draft"
+        entry = await asyncio.to_thread(self.store.get_write, idempotency_key(email))
+        if entry is not None and entry["status"] == WRITE_DONE:
+            logger.info(f"Reply to email {email.id} already written, skipping")
+            record_gmail_write(action, "duplicate")
+            return entry["gmail_id"]
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Writes queued in a previous event loop can't complete anymore
+            self._loop, self._queue, self._flusher = loop, [], None
+        write = PendingWrite(email, reply_text, send, loop.create_future())
+        self._queue.append(write)
+        if self._flusher is None or self._flusher.done():
+            # Created outside of the email context: batch calls are not counted in the metrics of one email
+            self._flusher = contextvars.Context().run(loop.create_task, self._flush_queue())
+        return await write.future
+
+    async def _flush_queue(self):
+        while self._queue:
+            # Gathers the replies of the concurrent emails into the same batch
+            await asyncio.sleep(self.flush_seconds)
+            now = time.monotonic()
+            writes = [write for write in self._queue if write.available_at <= now][:self.batch_size]
+            if not writes:
+                continue
+            for write in writes:
+                self._queue.remove(write)
+            try:
+                results = await asyncio.to_thread(self._write_batch, writes)
+            except Exception as error:
+                results = {write.key: (None, error) for write in writes}
+            for write in writes:
+                await self._handle_result(write, *results[write.key])
+
+    async def _handle_result(self, write: PendingWrite, gmail_id, error):
+        if write.future.done():
+            return
+        if error is None:
+            record_gmail_write(write.action, "ok", time.perf_counter() - write.queued_at)
+            write.future.set_result(gmail_id)
+            return
+
+        write.attempts += 1
+        if is_retryable_gmail_error(error) and write.attempts < self.max_attempts:
+            delay = self.backoff_delay(write.attempts)
+            logger.warning(
+                f"Gmail {write.action} of email {write.email.id} failed ({type(error).__name__}), "
+                f"retrying in {delay:.1f}s..."
+            )
+            record_gmail_write(write.action, "retry")
+            write.available_at = time.monotonic() + delay
+            self._queue.append(write)
+            return
+
+        logger.error(f"Gmail {write.action} of email {write.email.id} failed: {error}")
+        record_gmail_write(write.action, "failed")
+        await asyncio.to_thread(self.store.update_write, write.key, WRITE_FAILED, error=str(error))
+        write.future.set_exception(OutboundWriteError(f"Gmail {write.action} failed: {error}"))
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _write_batch(self, writes):
+        """
+        Writes the replies in Gmail batch requests, called in a worker thread.
+
+        @return: Dictionary mapping each idempotency key to a tuple of (Gmail id, error)
+        """
+        results = {}
+        to_write = []
+        for write in writes:
+            entry = self.store.get_write(write.key)
+            if entry is not None and entry["status"] == WRITE_DONE:
+                results[write.key] = (entry["gmail_id"], None)
+                continue
+            # A previous attempt (or a crashed process) may have reached Gmail: look for its reply first
+            if entry is not None and entry["status"] == WRITE_PENDING:
+                try:
+                    gmail_id = self.gmail_tools.find_reply(write.email.threadId, write.key)
+                except Exception as error:
+                    results[write.key] = (None, error)
+                    continue
+                if gmail_id is not None:
+                    self._complete(write, gmail_id)
+                    results[write.key] = (gmail_id, None)
+                    continue
+            self.store.start_write(write.key, write.email.threadId, write.action)
+            to_write.append(write)
+        if not to_write:
+            return results
+
+        try:
+            responses = self.gmail_tools.write_replies(
+                [(write.key, write.email, write.reply_text, write.send) for write in to_write]
+            )
+        except Exception as error:
+            # The outcome is unknown, the writes stay pending
+            responses = {write.key: (None, error) for write in to_write}
+
+        for write in to_write:
+            response, error = responses.get(write.key, (None, ConnectionError("No response in the batch")))
+            if error is None:
+                gmail_id = response.get("id")
+                self._complete(write, gmail_id)
+                results[write.key] = (gmail_id, None)
+                continue
+            # An error answered by Gmail (other than a server error) means nothing was written
+            status = getattr(getattr(error, "resp", None), "status", None)
+            if status is not None and status < 500:
+                self.store.update_write(write.key, WRITE_REJECTED, error=str(error))
+            results[write.key] = (None, error)
+        return results
+
+    def _complete(self, write: PendingWrite, gmail_id):
+        self.store.update_write(write.key, WRITE_DONE, gmail_id=gmail_id)
+        self.store.update_thread(write.email.threadId, write.email.id, SENT if write.send else DRAFTED)
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import logging
+import urllib.request
+from .graph import Workflow
+from .state import Email
+from .work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+# Job kinds of the ingestion queue
+NOTIFICATION_JOB = "notification"
+EMAIL_JOB = "email"
+# Gmail watches expire after 7 days, renew them daily
+WATCH_RENEW_SECONDS = 24 * 3600
+# Interval between two checks for jobs stuck in processing
+QUEUE_RECOVERY_SECONDS = 60
+# Time idle workers wait before checking the queue again
+QUEUE_POLL_SECONDS = 0.5
+# Interval between two attempts of a standby process to take over the queue consumers
+CONSUMER_LOCK_RETRY_SECONDS = 60
+
+
+def decode_push_notification(envelope):
+    """
+    Decodes a Pub/Sub push request body sent for a Gmail watch.
+
+    @param envelope: {"message": {"data": base64 JSON, "messageId": ...}, "subscription": ...}
+    @return: Tuple of (Pub/Sub message id, {"emailAddress": ..., "historyId": ...})
+    """
+    message = envelope["message"]
+    data = json.loads(base64.b64decode(message["data"]).decode("utf-8"))
+    return message.get("messageId") or message.get("message_id"), data
+
+
+class PushIngestion:
+    """
+    Gmail push notification ingestion: notifications are stored in a durable work queue,
+    a single ingestion task turns them into new emails (from the Gmail history, no
+    mailbox scan) queued as email jobs, and a pool of worker tasks runs the email workflow.
+    Every API worker process queues notifications, the tasks consuming the queue only run
+    in the process holding the lock file next to the queue.
+    """
+    def __init__(self, workflow: Workflow = None, queue: WorkQueue = None, num_workers=None):
+        self.workflow = workflow or Workflow()
+        config = self.workflow.config
+        self.queue = queue or WorkQueue(config.work_queue_path, max_attempts=config.queue_max_attempts)
+        self.num_workers = num_workers or config.push_workers
+        self.topic_name = config.push_topic
+        self._stop = None
+        self._tasks = []
+        self._lock_file = None
+
+    def handle_notification(self, envelope):
+        """
+        Queues a received push notification, called by the HTTP endpoint.
+
+        @return: True if the notification was queued, False if it was already received
+        """
+        message_id, data = decode_push_notification(envelope)
+        return self.queue.put(NOTIFICATION_JOB, data, dedup_key=f"pubsub:{message_id}")
+
+    async def start(self):
+        """Starts the watch renewal, ingestion and email worker tasks in the running event loop."""
+        self._stop = asyncio.Event()
+        if not self._acquire_consumer_lock():
+            logger.info("Push ingestion runs in another process, notifications are only queued")
+            self._tasks = [asyncio.create_task(self._wait_for_consumer_lock())]
+            return
+        await self._start_consumers()
+
+    async def stop(self):
+        """Stops the tasks once their current job is finished, unfinished jobs stay queued."""
+        self._stop.set()
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _start_consumers(self):
+        requeued = await asyncio.to_thread(self.queue.recover)
+        if requeued:
+            logger.warning(f"Requeued {requeued} jobs interrupted by the last shutdown")
+
+        workers = [self._ingest_notifications()] + [self._process_emails() for _ in range(self.num_workers)]
+        if self.topic_name:
+            workers.append(self._renew_watch())
+        self._tasks += [asyncio.create_task(worker) for worker in workers]
+        logger.info(f"Push ingestion started with {self.num_workers} workers")
+
+    def _acquire_consumer_lock(self):
+        """
+        Takes the lock file of the queue, so a single process (e.g. one of the gunicorn workers)
+        syncs the Gmail history and processes the queued emails.
+
+        @return: True if this process holds the lock
+        """
+        try:
+            import fcntl
+        except ImportError:
+            # No file locks (Windows): single process servers only
+            return True
+        lock_file = open(f"{os.path.abspath(self.queue.db_path)}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _wait_for_consumer_lock(self):
+        # Takes over the consumers when the process holding the lock exits
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=CONSUMER_LOCK_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                if self._acquire_consumer_lock():
+                    await self._start_consumers()
+                    return
+
+    async def _renew_watch(self):
+        await self.workflow.nodes.ensure_ready()
+        gmail_tools = self.workflow.nodes.gmail_tools
+        while not self._stop.is_set():
+            try:
+                response = await asyncio.to_thread(gmail_tools.watch_inbox, self.topic_name)
+                logger.info(f"Gmail watch active until {response.get('expiration')}")
+            except Exception as error:
+                logger.error(f"Gmail watch renewal failed: {error}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=WATCH_RENEW_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _ingest_notifications(self):
+        nodes = self.workflow.nodes
+        await nodes.ensure_ready()
+        gmail_tools = nodes.gmail_tools
+        last_recovery = time.monotonic()
+        while not self._stop.is_set():
+            # Requeue the jobs of crashed processes sharing the queue
+            if time.monotonic() - last_recovery > QUEUE_RECOVERY_SECONDS:
+                await asyncio.to_thread(self.queue.recover)
+                last_recovery = time.monotonic()
+
+            # Every pending notification is covered by a single history sync
+            jobs = await asyncio.to_thread(self.queue.claim, NOTIFICATION_JOB, limit=100, timeout=0)
+            if not jobs:
+                await asyncio.sleep(QUEUE_POLL_SECONDS)
+                continue
+            try:
+                # Notifications only carry a historyId, new emails are listed from the history
+                # (Gmail errors are raised, the notifications are retried)
+                messages, history_id = await asyncio.to_thread(gmail_tools.fetch_new_emails)
+                emails = await asyncio.to_thread(gmail_tools.get_unanswered_emails, messages)
+                state = {"emails": [Email(**email) for email in emails]}
+                if state["emails"]:
+                    if self.workflow.config.triage_mode == "batch":
+                        state.update(await nodes.triage_inbox_emails(state))
+                    for send in nodes.dispatch_emails(state):
+                        email_state = dict(send.arg, current_email=send.arg["current_email"].model_dump())
+                        await asyncio.to_thread(
+                            self.queue.put, EMAIL_JOB, email_state,
+                            dedup_key=f"email:{email_state['current_email']['id']}"
+                        )
+                # The emails are queued, the next sync starts after them
+                await asyncio.to_thread(gmail_tools.sync_store.set_history_id, history_id)
+            except Exception as error:
+                logger.error(f"Notification ingestion failed: {error}")
+                for job_id, _ in jobs:
+                    await asyncio.to_thread(self.queue.fail, job_id, error)
+                continue
+            for job_id, _ in jobs:
+                await asyncio.to_thread(self.queue.complete, job_id)
+
+    async def _process_emails(self):
+        while not self._stop.is_set():
+            jobs = await asyncio.to_thread(self.queue.claim, EMAIL_JOB, timeout=0)
+            if not jobs:
+                await asyncio.sleep(QUEUE_POLL_SECONDS)
+            for job_id, email_state in jobs:
+                email_state["current_email"] = Email(**email_state["current_email"])
+                try:
+                    await self.workflow.run_email(email_state)
+                except Exception as error:
+                    logger.error(f"Processing email {email_state['current_email'].id} failed: {error}")
+                    await asyncio.to_thread(self.queue.fail, job_id, error)
+                else:
+                    await asyncio.to_thread(self.queue.complete, job_id)
+
+
+def send_fake_notification(url, history_id, email_address="me@example.com", message_id=None):
+    """Posts a Pub/Sub formatted Gmail notification to a push endpoint, for local testing."""
+    data = json.dumps({"emailAddress": email_address, "historyId": int(history_id)})
+    envelope = {
+        "message": {
+            "data": base64.b64encode(data.encode("utf-8")).decode("ascii"),
+            "messageId": message_id or f"fake-{history_id}",
+        },
+        "subscription": "projects/local/subscriptions/gmail-push",
+    }
+    request = urllib.request.Request(
+        url, data=json.dumps(envelope).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.push <push endpoint url> <historyId>
+    # e.g. python -m src.push "http://localhost:8000/gmail/push?token=secret" 12345
+    status = send_fake_notification(sys.argv[1], sys.argv[2])
+    print(f"Fake notification sent, endpoint answered {status}")
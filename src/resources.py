@@ -0,0 +1,127 @@
+import os
+import time
+import logging
+import threading
+from .metrics import RESOURCE_INIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of the expensive resources shared by every workflow of the process
+    (LLM clients, embeddings, vector store, Gmail client). Each resource is created on first
+    use, once per process: a forked worker drops the resources of its parent (sockets & SQLite
+    connections can't be shared across processes) and creates its own.
+    """
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        # (name, *key) -> resource
+        self._resources = {}
+        # (name, *key) -> lock held while the resource is created
+        self._creation_locks = {}
+        # name -> seconds taken to create the resource
+        self._timings = {}
+        self._errors = {}
+
+    def get(self, name, factory, *key):
+        """
+        Returns the shared resource, created with the factory on first use.
+
+        @param name: Resource name, reported in the status
+        @param factory: Function creating the resource
+        @param key: Settings the resource depends on, different settings get their own instance
+        """
+        resource_key = (name, *key)
+        resource = self._resources.get(resource_key)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(resource_key, threading.Lock())
+        # Resources are created in parallel, concurrent callers of the same one wait for it
+        with creation_lock:
+            if resource_key not in self._resources:
+                start = time.perf_counter()
+                try:
+                    resource = factory()
+                except Exception as error:
+                    self._errors[name] = str(error)
+                    raise
+                elapsed = time.perf_counter() - start
+                self._resources[resource_key] = resource
+                self._timings[name] = elapsed
+                self._errors.pop(name, None)
+                RESOURCE_INIT_SECONDS.labels(name).set(elapsed)
+                logger.info(f"Created {name} in {elapsed:.2f}s")
+            return self._resources[resource_key]
+
+    def status(self):
+        """Creation time of the created resources and errors of the failed ones."""
+        return {
+            "pid": os.getpid(),
+            "resources": {name: round(seconds, 3) for name, seconds in self._timings.items()},
+            "errors": dict(self._errors),
+        }
+
+
+registry = ResourceRegistry()
+
+
+# Heavy libraries (LLM providers, chromadb, googleapiclient) are imported on first use only
+
+def shared_llm_router(config):
+    from .llm_router import LLMRouter
+    return registry.get(
+        "llm_router", lambda: LLMRouter.from_config(config),
+        tuple(config.llm_models), config.llm_requests_per_second, config.llm_max_rounds, config.llm_timeout
+    )
+
+
+def shared_embeddings(config):
+    from .embeddings import get_embeddings
+    return registry.get(
+        "embeddings",
+        lambda: get_embeddings(config.embedding_backend, config.embedding_model, config.embedding_cache_path),
+        config.embedding_backend, config.embedding_model, config.embedding_cache_path
+    )
+
+
+def shared_vectorstore(config):
+    embeddings = shared_embeddings(config)
+
+    def create():
+        from langchain_chroma import Chroma
+        return Chroma(persist_directory=config.vectorstore_dir, embedding_function=embeddings)
+
+    return registry.get(
+        "vectorstore", create,
+        config.vectorstore_dir, config.embedding_backend, config.embedding_model, config.embedding_cache_path
+    )
+
+
+def shared_agents(config):
+    from .agents import Agents
+    return registry.get("agents", lambda: Agents(config), config.model_dump_json())
+
+
+def shared_gmail_tools(config):
+    from .tools.GmailTools import GmailToolsClass
+    from .tools.BodyExtractor import BodyExtractor
+
+    def create():
+        body_extractor = BodyExtractor(config.email_body_max_chars, config.html_parser, config.strip_quoted_text)
+        return GmailToolsClass(
+            incremental_sync=config.incremental_sync, sync_db_path=config.sync_db_path,
+            body_extractor=body_extractor
+        )
+
+    return registry.get(
+        "gmail_tools", create,
+        config.incremental_sync, config.sync_db_path,
+        config.email_body_max_chars, config.html_parser, config.strip_quoted_text
+    )
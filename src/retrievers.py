@@ -0,0 +1,134 @@
+import os
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Any, List, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-process BM25 keyword index over the knowledge base chunks,
+    catches exact terms (plan names, prices, ...) that vector search can miss.
+    """
+    def __init__(self, documents: List[Document], k1=1.5, b=0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = []
+        # term -> list of (document index, term frequency)
+        self.postings = defaultdict(list)
+        for i, doc in enumerate(documents):
+            terms = Counter(tokenize(doc.page_content))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings[term].append((i, frequency))
+        self.avg_doc_length = sum(self.doc_lengths) / len(documents) if documents else 0
+        self.idf = {
+            term: math.log(1 + (len(documents) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        """Builds the index from the chunks already stored in the Chroma vector store."""
+        data = vectorstore.get(include=["documents", "metadatas"])
+        documents = [
+            Document(page_content=content, metadata=metadata or {})
+            for content, metadata in zip(data["documents"], data["metadatas"])
+        ]
+        return cls(documents)
+
+    def search(self, query, k=3):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for i, frequency in self.postings.get(term, []):
+                length_norm = 1 - self.b + self.b * self.doc_lengths[i] / self.avg_doc_length
+                scores[i] += self.idf[term] * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [self.documents[i] for i in best]
+
+
+class CrossEncoderReranker:
+    """Reranks retrieved chunks with a small CPU cross-encoder (needs sentence-transformers)."""
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as error:
+            raise ImportError(
+                "Reranking requires sentence-transformers, install it with `pip install sentence-transformers`"
+            ) from error
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def rerank(self, query, documents, k):
+        if not documents:
+            return documents
+        scores = self.model.predict([(query, doc.page_content) for doc in documents])
+        ranked = sorted(zip(scores, range(len(documents))), reverse=True)
+        return [documents[i] for _, i in ranked[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses vector search results and BM25 keyword results with reciprocal rank fusion,
+    then optionally reranks the fused candidates.
+    """
+    vectorstore: Any
+    k: int = 3
+    fetch_k: int = 10
+    rrf_k: int = 60
+    reranker: Optional[Any] = None
+    index_path: Optional[str] = None
+    _vector_retriever: Any = None
+    _bm25: Optional[BM25Index] = None
+    _index_version: Optional[int] = None
+    _lock: Any = None
+
+    def model_post_init(self, __context):
+        self._lock = threading.Lock()
+        self._vector_retriever = self.vectorstore.as_retriever(search_kwargs={"k": self.fetch_k})
+
+    def _get_bm25(self):
+        # Rebuild the keyword index when the vector store has been re-indexed
+        with self._lock:
+            index_version = self._get_index_version()
+            if self._bm25 is None or index_version != self._index_version:
+                self._bm25 = BM25Index.from_vectorstore(self.vectorstore)
+                self._index_version = index_version
+            return self._bm25
+
+    def _get_index_version(self):
+        if not self.index_path:
+            return None
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector_docs = self._vector_retriever.invoke(query)
+        keyword_docs = self._get_bm25().search(query, self.fetch_k)
+
+        # Reciprocal rank fusion, chunks are matched on their content
+        scores = defaultdict(float)
+        documents = {}
+        for ranking in (vector_docs, keyword_docs):
+            for rank, doc in enumerate(ranking):
+                scores[doc.page_content] += 1 / (self.rrf_k + rank + 1)
+                documents.setdefault(doc.page_content, doc)
+        fused = [documents[content] for content in sorted(scores, key=scores.get, reverse=True)]
+
+        if self.reranker is not None:
+            return self.reranker.rerank(query, fused, self.k)
+        return fused[:self.k]
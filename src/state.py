@@ -1,7 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Annotated
-from typing_extensions import TypedDict
-from langgraph.graph.message import add_messages
+from typing import Dict, List
+from typing_extensions import NotRequired, TypedDict
 
 class Email(BaseModel):
     id: str = Field(..., description="Unique identifier of the email")
@@ -11,14 +10,24 @@ class Email(BaseModel):
     sender: str = Field(..., description="Email address of the sender")
     subject: str = Field(..., description="Subject line of the email")
     body: str = Field(..., description="Body content of the email")
+    headers: Dict[str, str] = Field(default_factory=dict, description="Headers used to detect automated emails")
     
 class GraphState(TypedDict):
     emails: List[Email]
+    # Results of the inbox-level batch triage, keyed by email id
+    email_categories: NotRequired[Dict[str, str]]
+    email_rag_queries: NotRequired[Dict[str, List[str]]]
+
+class EmailState(TypedDict):
     current_email: Email
     email_category: str
     generated_email: str
     rag_queries: List[str]
     retrieved_documents: str
-    writer_messages: Annotated[list, add_messages]
+    # Earlier messages of the email thread (older ones summarized)
+    thread_context: str
+    writer_messages: List[str]
     sendable: bool
-    trials: int
\ No newline at end of file
+    trials: int
+    # Estimated prompt tokens sent to the writer & proofreader for this email
+    prompt_tokens: int
@@ -15,6 +15,23 @@ class CategorizeEmailOutput(BaseModel):
         description="The category assigned to the email, indicating its type based on predefined rules."
     )
 
+# **Batch Categorize Emails Output**
+class EmailCategoryItem(BaseModel):
+    email_id: str = Field(
+        ..., 
+        description="The ID of the categorized email, exactly as given in the input."
+    )
+    category: EmailCategory = Field(
+        ..., 
+        description="The category assigned to the email, indicating its type based on predefined rules."
+    )
+
+class BatchCategorizeEmailOutput(BaseModel):
+    items: List[EmailCategoryItem] = Field(
+        ..., 
+        description="One category per input email."
+    )
+
 # **RAG Query Output**
 class RAGQueriesOutput(BaseModel):
     queries: List[str] = Field(
@@ -22,6 +39,34 @@ class RAGQueriesOutput(BaseModel):
         description="A list of up to three questions representing the customer's intent, based on their email."
     )
 
+# **Batch RAG Queries Output**
+class EmailQueriesItem(BaseModel):
+    email_id: str = Field(
+        ..., 
+        description="The ID of the email, exactly as given in the input."
+    )
+    queries: List[str] = Field(
+        ..., 
+        description="A list of up to three questions representing the customer's intent, based on their email."
+    )
+
+class BatchRAGQueriesOutput(BaseModel):
+    items: List[EmailQueriesItem] = Field(
+        ..., 
+        description="The RAG queries of each input email."
+    )
+
+# **Triage Email Output** (category & RAG queries in a single call)
+class TriageEmailOutput(BaseModel):
+    category: EmailCategory = Field(
+        ..., 
+        description="The category assigned to the email, indicating its type based on predefined rules."
+    )
+    queries: List[str] = Field(
+        default_factory=list, 
+        description="For product enquiries only, a list of up to three questions representing the customer's intent. Empty for other categories."
+    )
+
 # **Email Writer Output**
 class WriterOutput(BaseModel):
     email: str = Field(
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from .state import Email
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadContextBuilder:
+    """
+    Builds the context of the earlier messages of an email thread for the writer, within a
+    token budget: the latest messages are kept as is, the older ones are summarized.
+    The text of each message is cached by message id and the summary is extended with the
+    new messages only, so a new reply in a long thread doesn't re-summarize the whole thread.
+    """
+    def __init__(self, gmail_tools, summarizer, token_budget=1500, summarizer_input_tokens=16000):
+        """
+        @param gmail_tools: GmailToolsClass fetching the threads, its sync store caches the texts & summaries
+        @param summarizer: Agent extending a summary with new messages
+        @param token_budget: Maximum (estimated) tokens of the thread context
+        @param summarizer_input_tokens: Maximum (estimated) tokens of messages summarized in one call
+        """
+        self.gmail_tools = gmail_tools
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.summarizer_input_tokens = summarizer_input_tokens
+
+    @property
+    def store(self):
+        return self.gmail_tools.sync_store
+
+    async def build(self, email: Email, run_config=None):
+        """
+        Returns the context of the messages preceding the email in its thread ("" for a new thread).
+
+        @param email: Email being answered
+        @param run_config: Run config of the summarizer calls
+        """
+        # First message of its thread, nothing to fetch
+        if not email.references:
+            return ""
+
+        messages = await asyncio.to_thread(self._earlier_messages, email)
+        if not messages:
+            return ""
+
+        turns = [self._format_turn(sender, text) for _, sender, text in messages]
+        if estimate_tokens("\n\n".join(turns)) <= self.token_budget:
+            return "\n\n".join(turns)
+
+        # Latest messages as is in half of the budget, the older ones are summarized in the other half
+        split, recent_tokens = len(turns), 0
+        while split > 0 and recent_tokens + estimate_tokens(turns[split - 1]) <= self.token_budget // 2:
+            split -= 1
+            recent_tokens += estimate_tokens(turns[split])
+
+        # Reuse the cached summary, only the messages added since it was written are summarized
+        summary, summarized = "", 0
+        message_ids = [message_id for message_id, _, _ in messages]
+        cached = await asyncio.to_thread(self.store.get_thread_summary, email.threadId)
+        if cached is not None and cached[0] in message_ids:
+            summarized = message_ids.index(cached[0]) + 1
+            summary = cached[1]
+        if summarized < split:
+            summary = await self._summarize(summary, messages[summarized:split], run_config)
+            await asyncio.to_thread(self.store.set_thread_summary, email.threadId, message_ids[split - 1], summary)
+            summarized = split
+        else:
+            logger.info("Thread summary found in cache")
+        return "\n\n".join([f"**Summary of the earlier messages:**\n{summary}"] + turns[summarized:])
+
+    def _earlier_messages(self, email: Email):
+        """Fetches the thread once, only the bodies of messages not cached yet are extracted."""
+        cached = self.store.get_message_texts(email.threadId)
+        # The body of the email itself is already known too
+        thread = self.gmail_tools.fetch_thread(email.threadId, known_ids=set(cached) | {email.id})
+        messages = []
+        for message in thread:
+            if message["id"] == email.id:
+                break
+            # Unsent drafts were never part of the conversation
+            if "DRAFT" in message["labels"]:
+                continue
+            if message["body"] is not None:
+                cached[message["id"]] = (message["sender"], message["body"])
+                self.store.set_message_text(message["id"], email.threadId, message["sender"], message["body"])
+            sender, text = cached[message["id"]]
+            messages.append((message["id"], sender, text))
+        return messages
+
+    async def _summarize(self, summary, messages, run_config=None):
+        """Extends the summary with the messages, in chunks fitting the summarizer input budget."""
+        logger.info(f"Summarizing {len(messages)} thread messages...")
+        summary_tokens = self.token_budget // 2
+        for chunk in self._chunk_messages(messages):
+            summary = await self.summarizer.ainvoke({
+                "summary": summary or "None, this is the beginning of the conversation.",
+                "messages": "\n\n".join(self._format_turn(sender, text) for _, sender, text in chunk),
+                "max_words": summary_tokens * 3 // 4,
+            }, config=run_config)
+            # Guard against summaries ignoring the word limit
+            summary = summary.strip()[:summary_tokens * 4]
+        return summary
+
+    def _chunk_messages(self, messages):
+        chunks, chunk, chunk_tokens = [], [], 0
+        for message in messages:
+            message_tokens = estimate_tokens(self._format_turn(message[1], message[2]))
+            if chunk and chunk_tokens + message_tokens > self.summarizer_input_tokens:
+                chunks.append(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(message)
+            chunk_tokens += message_tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    @staticmethod
+    def _format_turn(sender, text):
+        return f"**From:** {sender}\n{text}"
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict, defaultdict
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+def estimate_tokens(text):
+    """Rough token count of a text (about 4 characters per token), no tokenizer needed."""
+    return len(text) // 4 + 1
+
+
+def _empty_usage():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """
+    Records the prompt, completion and cached prompt tokens reported by the LLM providers,
+    per agent and per email. Agents are identified by the "agent" run metadata and emails
+    by the "email_id" run metadata. Only the latest emails are kept, as the callback lives as
+    long as the process (daemon, API).
+    """
+    def __init__(self, max_emails=1000):
+        """
+        @param max_emails: Number of emails whose usage is kept, the least recently used are dropped
+        """
+        self._lock = threading.Lock()
+        # run id -> (agent, email id) of the LLM runs in progress
+        self._runs = {}
+        self.max_emails = max_emails
+        self.by_agent = defaultdict(_empty_usage)
+        self.by_email = OrderedDict()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._register_run(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._register_run(run_id, metadata)
+
+    def _register_run(self, run_id, metadata):
+        metadata = metadata or {}
+        with self._lock:
+            self._runs[run_id] = (metadata.get("agent", "unknown"), metadata.get("email_id"))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = self._get_usage(response)
+        with self._lock:
+            agent, email_id = self._runs.pop(run_id, ("unknown", None))
+            targets = [self.by_agent[agent]]
+            if email_id is not None:
+                targets.append(self._email_entry(email_id))
+            for target in targets:
+                target["calls"] += 1
+                for key, value in usage.items():
+                    target[key] += value
+
+    def _email_entry(self, email_id):
+        """Usage of the email, marked as the most recently used (called with the lock held)."""
+        if email_id in self.by_email:
+            self.by_email.move_to_end(email_id)
+        else:
+            self.by_email[email_id] = _empty_usage()
+            while len(self.by_email) > self.max_emails:
+                self.by_email.popitem(last=False)
+        return self.by_email[email_id]
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    @staticmethod
+    def _get_usage(response):
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage_metadata = getattr(message, "usage_metadata", None)
+                if not usage_metadata:
+                    continue
+                usage["prompt_tokens"] += usage_metadata.get("input_tokens", 0)
+                usage["completion_tokens"] += usage_metadata.get("output_tokens", 0)
+                details = usage_metadata.get("input_token_details") or {}
+                usage["cached_tokens"] += details.get("cache_read", 0) or 0
+        return usage
+
+    def email_usage(self, email_id):
+        with self._lock:
+            return dict(self.by_email.get(email_id) or _empty_usage())
+
+    def summary(self):
+        with self._lock:
+            return {agent: dict(usage) for agent, usage in self.by_agent.items()}
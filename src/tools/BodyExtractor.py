@@ -0,0 +1,243 @@
+import re
+import base64
+import binascii
+
+# Tags never containing text of the message
+SKIPPED_TAGS = ("script", "style", "head", "title", "meta", "noscript", "template", "svg")
+# Quoted replies inserted by the common email clients (Gmail, Apple Mail, Outlook, Yahoo, Thunderbird)
+QUOTE_SELECTORS = (
+    "blockquote", "div.gmail_quote", "div.yahoo_quoted", "div#appendonsend",
+    "div#divRplyFwdMsg", "div.moz-cite-prefix",
+)
+QUOTE_XPATH = (
+    "//blockquote"
+    " | //div[contains(concat(' ', normalize-space(@class), ' '), ' gmail_quote ')]"
+    " | //div[contains(concat(' ', normalize-space(@class), ' '), ' yahoo_quoted ')]"
+    " | //div[contains(concat(' ', normalize-space(@class), ' '), ' moz-cite-prefix ')]"
+    " | //div[@id='appendonsend'] | //div[@id='divRplyFwdMsg']"
+)
+# HTML bodies are mostly markup: bytes of HTML parsed for each character of the text cap,
+# counted from the <body> tag (found within the hard limit, the <head> may be large)
+HTML_BYTES_PER_CHAR = 10
+HTML_MAX_BYTES_PER_CHAR = 80
+BODY_TAG_PATTERN = re.compile(r"<body\b", re.IGNORECASE)
+TRUNCATION_MARK = " [...]"
+
+# Lines introducing the quoted previous message of a reply
+REPLY_HEADER_PATTERNS = (
+    re.compile(r"^On\b.{0,300}\bwrote:$", re.IGNORECASE),
+    re.compile(r"^Le\b.{0,300}\ba écrit ?:$", re.IGNORECASE),
+    re.compile(r"^Am\b.{0,300}\bschrieb.{0,100}:$", re.IGNORECASE),
+    re.compile(r"^El\b.{0,300}\bescribió:$", re.IGNORECASE),
+    re.compile(r"^-{2,} ?Original Message ?-{2,}$", re.IGNORECASE),
+    re.compile(r"^_{10,}$"),
+)
+# Outlook reply header: "From: ..." followed by "Sent: ..." or "Date: ..."
+OUTLOOK_FROM_PATTERN = re.compile(r"^\*?From:\*? ", re.IGNORECASE)
+OUTLOOK_DATE_PATTERN = re.compile(r"^\*?(Sent|Date):\*? ", re.IGNORECASE)
+# Signature delimiter ("-- ") and mobile client footers
+SIGNATURE_PATTERNS = (
+    re.compile(r"^-- ?$"),
+    re.compile(r"^Sent from my \w+", re.IGNORECASE),
+    re.compile(r"^Get Outlook for \w+", re.IGNORECASE),
+)
+# Module imported by each HTML parser backend
+HTML_PARSER_MODULES = {"selectolax": "selectolax.lexbor", "lxml": "lxml.html", "html.parser": "bs4"}
+CHARSET_PATTERN = re.compile(r"charset=\"?([\w-]+)", re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def resolve_html_parser(name="auto"):
+    """
+    Picks the HTML parser backend: "selectolax" (fastest), "lxml" or "html.parser" (BeautifulSoup).
+
+    @param name: Backend name, "auto" uses the fastest installed one
+    @return: Name of the backend
+    """
+    if name == "auto":
+        for backend in ("selectolax", "lxml"):
+            try:
+                __import__(HTML_PARSER_MODULES[backend])
+                return backend
+            except ImportError:
+                continue
+        return "html.parser"
+    if name not in HTML_PARSER_MODULES:
+        raise ValueError(f"Unknown HTML parser: {name}")
+    try:
+        __import__(HTML_PARSER_MODULES[name])
+    except ImportError as error:
+        raise ImportError(
+            f"The {name} HTML parser is not installed, install it with `pip install {name}`"
+        ) from error
+    return name
+
+
+class BodyExtractor:
+    """
+    Extracts the new text of an email from its Gmail API payload. Only the beginning of
+    large parts is decoded, quoted replies & signatures are dropped and the text is capped,
+    so long marketing HTML or thread histories don't inflate the prompts.
+    """
+    def __init__(self, max_chars=8000, html_parser="auto", strip_quotes=True):
+        self.max_chars = max_chars
+        self.html_parser = resolve_html_parser(html_parser)
+        self.strip_quotes = strip_quotes
+
+    def extract(self, payload):
+        """
+        Returns the body text of a Gmail message payload, prioritizing text/plain over text/html.
+
+        @param payload: "payload" of a Gmail message fetched with format="full"
+        @return: Body text on a single line
+        """
+        part, mime_type = self._find_text_part(payload)
+        if part is None:
+            return ""
+        if mime_type == "text/html":
+            max_bytes = self._byte_limit(HTML_BYTES_PER_CHAR)
+            html = self._decode(part, self._byte_limit(HTML_MAX_BYTES_PER_CHAR))
+            if max_bytes is not None:
+                # Styles & conditional comments before <body> hold no text, the cap starts at the body
+                body = BODY_TAG_PATTERN.search(html)
+                start = body.start() if body else 0
+                html = html[start:start + max_bytes]
+            text = self.html_to_text(html)
+        else:
+            text = self._decode(part, self._byte_limit(4))
+        if self.strip_quotes:
+            text = self.strip_quoted_text(text)
+        return self._truncate(WHITESPACE_PATTERN.sub(" ", text).strip())
+
+    @staticmethod
+    def _find_text_part(payload):
+        """Walks the MIME tree, the first text/plain part wins over the first text/html part."""
+        html_part = None
+        stack = [payload]
+        while stack:
+            part = stack.pop()
+            mime_type = part.get("mimeType", "")
+            if mime_type == "text/plain" and part.get("body", {}).get("data"):
+                return part, mime_type
+            if mime_type == "text/html" and html_part is None and part.get("body", {}).get("data"):
+                html_part = part
+            # Depth-first, in the order of the parts
+            stack.extend(reversed(part.get("parts", [])))
+        if html_part is not None:
+            return html_part, "text/html"
+        # Single part message without a text mime type
+        if payload.get("body", {}).get("data"):
+            return payload, "text/plain"
+        return None, None
+
+    def _byte_limit(self, bytes_per_char):
+        return self.max_chars * bytes_per_char if self.max_chars else None
+
+    @staticmethod
+    def _base64_length(max_bytes):
+        # 4 base64 characters encode 3 bytes, cut on a full group
+        return (max_bytes + 2) // 3 * 4
+
+    @staticmethod
+    def _decode(part, max_bytes=None):
+        """Decodes the base64url data of a part, only its first max_bytes bytes when given."""
+        data = part["body"]["data"]
+        if max_bytes is not None:
+            data = data[:BodyExtractor._base64_length(max_bytes)]
+        try:
+            raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+        except (binascii.Error, ValueError):
+            return ""
+
+        charset = "utf-8"
+        for header in part.get("headers", []):
+            if header.get("name", "").lower() == "content-type":
+                match = CHARSET_PATTERN.search(header.get("value", ""))
+                if match:
+                    charset = match.group(1)
+        try:
+            text = raw.decode(charset, errors="replace")
+        except LookupError:
+            text = raw.decode("utf-8", errors="replace")
+        # A multi-byte character may have been cut by the limit
+        return text.rstrip("�")
+
+    def html_to_text(self, html):
+        """Visible text of an HTML body, one line per block (without the quoted replies if enabled)."""
+        if not html.strip():
+            return ""
+        text = self._html_to_text(html, self.strip_quotes)
+        if self.strip_quotes and not text:
+            # Nothing but a quote (e.g. a forwarded email): keep it
+            text = self._html_to_text(html, False)
+        return text
+
+    def _html_to_text(self, html, strip_quotes):
+        if self.html_parser == "selectolax":
+            from selectolax.lexbor import LexborHTMLParser
+            tree = LexborHTMLParser(html)
+            tree.strip_tags(list(SKIPPED_TAGS))
+            if strip_quotes:
+                for node in tree.css(", ".join(QUOTE_SELECTORS)):
+                    node.decompose()
+            root = tree.body or tree.root
+            return root.text(separator="\n", strip=True) if root else ""
+
+        if self.html_parser == "lxml":
+            from lxml import etree, html as lxml_html
+            try:
+                root = lxml_html.fromstring(html)
+            except (etree.ParserError, ValueError):
+                return ""
+            xpath = " | ".join(f"//{tag}" for tag in SKIPPED_TAGS)
+            if strip_quotes:
+                xpath += " | " + QUOTE_XPATH
+            for element in root.xpath(xpath):
+                if element.getparent() is not None:
+                    element.drop_tree()
+            lines = root.xpath("//text()")
+            return "\n".join(line.strip() for line in lines if line.strip())
+
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, "html.parser")
+        for tag in soup(list(SKIPPED_TAGS)):
+            tag.decompose()
+        if strip_quotes:
+            for tag in soup.select(", ".join(QUOTE_SELECTORS)):
+                tag.decompose()
+        return soup.get_text(separator="\n", strip=True)
+
+    @staticmethod
+    def strip_quoted_text(text):
+        """
+        Removes the quoted previous messages ("> " lines, "On ... wrote:" and Outlook reply headers)
+        and the signature of a plain text body. The text is kept as is if nothing would remain.
+        """
+        lines = [line.strip() for line in text.replace("\r", "").split("\n")]
+        kept = []
+        for i, line in enumerate(lines):
+            if line.startswith(">"):
+                continue
+            # Reply headers are often wrapped over two lines
+            next_line = lines[i + 1] if i + 1 < len(lines) else ""
+            if any(
+                pattern.match(line) or (next_line and pattern.match(f"{line} {next_line}"))
+                for pattern in REPLY_HEADER_PATTERNS
+            ):
+                break
+            if OUTLOOK_FROM_PATTERN.match(line) and any(
+                OUTLOOK_DATE_PATTERN.match(following) for following in lines[i + 1:i + 4]
+            ):
+                break
+            if any(pattern.match(line) for pattern in SIGNATURE_PATTERNS):
+                break
+            kept.append(line)
+
+        stripped = "\n".join(kept).strip()
+        return stripped or text
+
+    def _truncate(self, text):
+        if not self.max_chars or len(text) <= self.max_chars:
+            return text
+        cut = text.rfind(" ", 0, self.max_chars)
+        return text[:cut if cut > 0 else self.max_chars] + TRUNCATION_MARK
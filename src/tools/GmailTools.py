@@ -1,88 +1,248 @@
 import os
-import re
+import time
 import uuid
+import random
 import base64
-from bs4 import BeautifulSoup
+import logging
+import httplib2
+import threading
 from datetime import datetime, timedelta
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from .SyncStore import SyncStore, DRAFTED, SENT
+from .BodyExtractor import BodyExtractor
+from ..metrics import record_gmail_call
+from ..outbound import is_retryable_gmail_error
+
+logger = logging.getLogger(__name__)
 
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+# Gmail accepts at most 100 calls per batch request
+BATCH_SIZE = 100
+BATCH_PATH = "batch/gmail/v1"
+# Attempts of a message failing with a quota or server error in a batch request, and base backoff delay
+FETCH_ATTEMPTS = 4
+FETCH_RETRY_DELAY = 1.0
+# Header carrying the idempotency key of the replies, to find them after an uncertain write
+IDEMPOTENCY_HEADER = "X-Idempotency-Key"
+# Headers kept on emails to detect newsletters & automatic replies
+CLASSIFIER_HEADERS = (
+    "list-unsubscribe", "list-id", "auto-submitted", "precedence", "x-autoreply", "x-autorespond"
+)
 
 class GmailToolsClass:
-    def __init__(self):
-        self.service = self._get_gmail_service()
+    def __init__(
+        self, service=None, api_endpoint=None, incremental_sync=False, sync_db_path="gmail_sync.db",
+        body_extractor=None
+    ):
+        # api_endpoint points the client to another Gmail server (e.g. a local fake one)
+        self.api_endpoint = api_endpoint or os.environ.get("GMAIL_API_ENDPOINT")
+        # httplib2 connections are not thread-safe: unless a service is given,
+        # each thread gets its own Gmail service, built once and reused
+        self._service = service
+        self._local = threading.local()
+        self._credentials = None if (service or self.api_endpoint) else self._get_credentials()
+        if service is None:
+            self._local.service = self._get_gmail_service()
+        # local store keeping the last historyId & the ledger of processed threads
+        self.incremental_sync = incremental_sync
+        self.sync_store = SyncStore(sync_db_path)
+        # extracts the (capped) new text of the fetched emails
+        self.body_extractor = body_extractor or BodyExtractor()
         
-    def fetch_unanswered_emails(self, max_results=50):
+    def fetch_unanswered_emails(self, max_results=50, prefetch_metadata=True, skip_ids=()):
         """
         Fetches all emails included in unanswered threads.
+        Messages are downloaded with Gmail batch requests instead of one call per message.
 
         @param max_results: Maximum number of recent emails to fetch
+        @param prefetch_metadata: Fetch headers first to filter out emails before downloading full bodies
+        @param skip_ids: Ids of the emails already being processed, never downloaded
         @return: List of dictionaries, each representing a thread with its emails
         """
         try:
-            # Get recent emails and organize them into threads
-            recent_emails = self.fetch_recent_emails(max_results)
-            if not recent_emails: return []
-            
-            # Get all draft replies
-            drafts = self.fetch_draft_replies()
-
-            # Create a set of thread IDs that have drafts
-            threads_with_drafts = {draft['threadId'] for draft in drafts}
-
-            # Process new emails
-            seen_threads = set()
-            unanswered_emails = []
-            for email in recent_emails:
-                thread_id = email['threadId']
-                if thread_id not in seen_threads and thread_id not in threads_with_drafts:
-                    seen_threads.add(thread_id)
-                    email_info = self._get_email_info(email['id'])
-                    if self._should_skip_email(email_info):
-                        continue
-                    unanswered_emails.append(email_info)
+            history_id = None
+            if self.incremental_sync:
+                # Only fetch the messages added since the last sync
+                recent_emails, history_id = self.fetch_new_emails(max_results)
+            else:
+                # Get recent emails and organize them into threads
+                recent_emails = self.fetch_recent_emails(max_results)
+            unanswered_emails = self.get_unanswered_emails(recent_emails, prefetch_metadata, skip_ids)
+            # Stored once the listed messages are fetched, otherwise the next sync lists them again
+            if history_id:
+                self.sync_store.set_history_id(history_id)
             return unanswered_emails
 
         except Exception as e:
-            print(f"An error occurred: {e}")
+            logger.error(f"An error occurred: {e}")
             return []
 
+    def get_unanswered_emails(self, recent_emails, prefetch_metadata=True, skip_ids=()):
+        """
+        Downloads the latest email of each listed thread not already handled in the ledger.
+
+        @param recent_emails: List of {"id", "threadId"} dictionaries, newest first
+        @param prefetch_metadata: Fetch headers first to filter out emails before downloading full bodies
+        @param skip_ids: Ids of the emails already being processed, never downloaded
+        @return: List of dictionaries, each representing an email to answer
+        """
+        if not recent_emails: return []
+
+        # Keep the latest email of each thread not already handled in the ledger
+        seen_threads = set()
+        candidate_ids = []
+        for email in recent_emails:
+            thread_id = email['threadId']
+            if thread_id in seen_threads:
+                continue
+            seen_threads.add(thread_id)
+            if email['id'] in skip_ids:
+                continue
+            if self.sync_store.is_processed(thread_id, email['id']):
+                continue
+            candidate_ids.append(email['id'])
+
+        # Filter on headers before downloading the full bodies
+        if prefetch_metadata and candidate_ids:
+            metadata = self._get_messages_batch(
+                candidate_ids, format="metadata", metadata_headers=["From"]
+            )
+            candidate_ids = [
+                msg_id for msg_id in candidate_ids
+                if msg_id in metadata and not self._should_skip_email(
+                    {"sender": self._get_headers(metadata[msg_id]).get("from", "Unknown")}
+                )
+            ]
+
+        messages = self._get_messages_batch(candidate_ids, format="full")
+        unanswered_emails = []
+        for msg_id in candidate_ids:
+            if msg_id not in messages:
+                continue
+            email_info = self._parse_email_info(messages[msg_id])
+            if self._should_skip_email(email_info):
+                continue
+            # A new message with the same text (e.g. "Any update?") is answered again,
+            # only redelivered messages are skipped above by their id
+            self.sync_store.mark_seen(email_info["threadId"], msg_id)
+            unanswered_emails.append(email_info)
+        return unanswered_emails
+
     def fetch_recent_emails(self, max_results=50):
         try:
-            # Set delay of 8 hours
-            now = datetime.now()
-            delay = now - timedelta(hours=8)
-
-            # Format for Gmail query
-            after_timestamp = int(delay.timestamp())
-            before_timestamp = int(now.timestamp())
-
-            # Query to get emails from the last 8 hours
-            query = f"after:{after_timestamp} before:{before_timestamp}"
-            results = self.service.users().messages().list(
-                userId="me", q=query, maxResults=max_results
-            ).execute()
-            messages = results.get("messages", [])
-            
-            return messages
-        
+            return self._list_recent_emails(max_results)
         except Exception as error:
-            print(f"An error occurred while fetching emails: {error}")
+            logger.error(f"An error occurred while fetching emails: {error}")
             return []
-        
+
+    def _list_recent_emails(self, max_results=50):
+        """Lists the emails of the last 8 hours, Gmail errors are raised."""
+        # Set delay of 8 hours
+        now = datetime.now()
+        delay = now - timedelta(hours=8)
+
+        # Format for Gmail query
+        after_timestamp = int(delay.timestamp())
+        before_timestamp = int(now.timestamp())
+
+        # Query to get emails from the last 8 hours
+        query = f"after:{after_timestamp} before:{before_timestamp}"
+        results = self._execute(self.service.users().messages().list(
+            userId="me", q=query, maxResults=max_results
+        ), "messages.list")
+        return results.get("messages", [])
+
+    def fetch_new_emails(self, max_results=50):
+        """
+        Lists the inbox emails added since the last sync using the Gmail history API.
+        Falls back to a full scan of recent emails when there is no stored historyId
+        or when it has expired.
+
+        @param max_results: Maximum number of emails to fetch on a full scan
+        @return: Tuple of (list of {"id", "threadId"} dictionaries newest first, historyId to store
+                 in the sync store once these emails are fetched)
+        """
+        from googleapiclient.errors import HttpError
+        history_id = self.sync_store.get_history_id()
+        if history_id:
+            try:
+                return self._fetch_history(history_id)
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                logger.warning("Gmail history expired, falling back to a full scan...")
+
+        # Take the current historyId before scanning so no message is missed
+        # (a failed scan is raised, the stored historyId is kept for the next sync)
+        profile = self._execute(self.service.users().getProfile(userId="me"), "getProfile")
+        messages = self._list_recent_emails(max_results)
+        return messages, profile["historyId"]
+
+    def _fetch_history(self, start_history_id):
+        """
+        Lists the messages added to the inbox after the given historyId.
+
+        @return: Tuple of (messages newest first, latest historyId)
+        """
+        messages = []
+        page_token = None
+        while True:
+            response = self._execute(self.service.users().history().list(
+                userId="me",
+                startHistoryId=start_history_id,
+                historyTypes=["messageAdded"],
+                labelId="INBOX",
+                pageToken=page_token
+            ), "history.list")
+            for record in response.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message = added["message"]
+                    messages.append({"id": message["id"], "threadId": message["threadId"]})
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        messages.reverse()
+        return messages, response.get("historyId", start_history_id)
+
+    def watch_inbox(self, topic_name):
+        """
+        Asks Gmail to publish inbox changes to a Pub/Sub topic (the watch expires after 7 days,
+        it must be renewed at least once a week).
+
+        @param topic_name: Full Pub/Sub topic name, e.g. "projects/my-project/topics/gmail"
+        @return: Dictionary with the current "historyId" and the watch "expiration"
+        """
+        response = self._execute(self.service.users().watch(
+            userId="me",
+            body={"topicName": topic_name, "labelIds": ["INBOX"], "labelFilterBehavior": "include"}
+        ), "watch")
+        # Notifications only carry a historyId, emails are listed from the history starting here
+        if not self.sync_store.get_history_id():
+            self.sync_store.set_history_id(response["historyId"])
+        return response
+
+    def stop_watch(self):
+        """Stops the inbox push notifications."""
+        self._execute(self.service.users().stop(userId="me"), "stop")
+
     def fetch_draft_replies(self):
         """
         Fetches all draft email replies from Gmail.
         """
         try:
-            drafts = self.service.users().drafts().list(userId="me").execute()
-            draft_list = drafts.get("drafts", [])
+            draft_list = []
+            page_token = None
+            while True:
+                drafts = self._execute(self.service.users().drafts().list(
+                    userId="me", pageToken=page_token
+                ), "drafts.list")
+                draft_list.extend(drafts.get("drafts", []))
+                page_token = drafts.get("nextPageToken")
+                if not page_token:
+                    break
             return [
                 {
                     "draft_id": draft["id"],
@@ -93,7 +253,7 @@ class GmailToolsClass:
             ]
 
         except Exception as error:
-            print(f"An error occurred while fetching drafts: {error}")
+            logger.error(f"An error occurred while fetching drafts: {error}")
             return []
 
     def create_draft_reply(self, initial_email, reply_text):
@@ -102,13 +262,14 @@ class GmailToolsClass:
             message = self._create_reply_message(initial_email, reply_text)
 
             # Create draft with thread information
-            draft = self.service.users().drafts().create(
+            draft = self._execute(self.service.users().drafts().create(
                 userId="me", body={"message": message}
-            ).execute()
+            ), "drafts.create")
 
+            self.sync_store.update_thread(initial_email.threadId, initial_email.id, DRAFTED)
             return draft
         except Exception as error:
-            print(f"An error occurred while creating draft: {error}")
+            logger.error(f"An error occurred while creating draft: {error}")
             return None
 
     def send_reply(self, initial_email, reply_text):
@@ -117,17 +278,57 @@ class GmailToolsClass:
             message = self._create_reply_message(initial_email, reply_text, send=True)
 
             # Send the message with thread ID
-            sent_message = self.service.users().messages().send(
+            sent_message = self._execute(self.service.users().messages().send(
                 userId="me", body=message
-            ).execute()
+            ), "messages.send")
+
+            self.sync_store.update_thread(initial_email.threadId, initial_email.id, SENT)
             
             return sent_message
 
         except Exception as error:
-            print(f"An error occurred while sending reply: {error}")
+            logger.error(f"An error occurred while sending reply: {error}")
             return None
         
-    def _create_reply_message(self, email, reply_text, send=False):
+    def write_replies(self, replies):
+        """
+        Creates the drafts and sends the replies using Gmail batch requests (up to 100 calls per request).
+
+        @param replies: List of (idempotency key, initial email, reply text, send) tuples
+        @return: Dictionary mapping each idempotency key to a tuple of (response, error)
+        """
+        results = {}
+
+        def on_response(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        for start in range(0, len(replies), BATCH_SIZE):
+            batch = self._new_batch_request(on_response)
+            for key, initial_email, reply_text, send in replies[start:start + BATCH_SIZE]:
+                message = self._create_reply_message(initial_email, reply_text, send=send, idempotency_key=key)
+                if send:
+                    request = self.service.users().messages().send(userId="me", body=message)
+                else:
+                    request = self.service.users().drafts().create(userId="me", body={"message": message})
+                batch.add(request, request_id=key)
+            self._execute(batch, "batch.replies")
+        return results
+
+    def find_reply(self, thread_id, idempotency_key):
+        """
+        Looks for a reply (draft or sent message) of the thread carrying the idempotency key.
+
+        @return: Id of the reply message, None if there is none
+        """
+        thread = self._execute(self.service.users().threads().get(
+            userId="me", id=thread_id, format="metadata", metadataHeaders=[IDEMPOTENCY_HEADER]
+        ), "threads.get")
+        for message in thread.get("messages", []):
+            if self._get_headers(message).get(IDEMPOTENCY_HEADER.lower()) == idempotency_key:
+                return message["id"]
+        return None
+
+    def _create_reply_message(self, email, reply_text, send=False, idempotency_key=None):
         # Create message with proper headers
         message = self._create_html_email_message(
             recipient=email.sender,
@@ -144,6 +345,8 @@ class GmailToolsClass:
             if send:
                 # Generate a new Message-ID for this reply
                 message["Message-ID"] = f"<{uuid.uuid4()}@gmail.com>"
+        if idempotency_key:
+            message[IDEMPOTENCY_HEADER] = idempotency_key
                 
         # Construct email body
         body = {
@@ -154,7 +357,29 @@ class GmailToolsClass:
         return body
 
         
+    @property
+    def service(self):
+        if self._service is not None:
+            return self._service
+        if getattr(self._local, "service", None) is None:
+            self._local.service = self._get_gmail_service()
+        return self._local.service
+
     def _get_gmail_service(self):
+        # The Google client libraries are slow to import, only load them when needed
+        from googleapiclient.discovery import build
+        if self.api_endpoint:
+            # Custom servers (e.g. local fake Gmail) are called without OAuth
+            return build(
+                'gmail', 'v1', http=httplib2.Http(),
+                client_options={"api_endpoint": self.api_endpoint}
+            )
+        return build('gmail', 'v1', credentials=self._credentials)
+
+    def _get_credentials(self):
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
         creds = None
         if os.path.exists('token.json'):
             creds = Credentials.from_authorized_user_file('token.json', SCOPES)
@@ -166,80 +391,132 @@ class GmailToolsClass:
                 creds = flow.run_local_server(port=0)
             with open('token.json', 'w') as token:
                 token.write(creds.to_json())
-        
-        return build('gmail', 'v1', credentials=creds)
+        return creds
     
     def _should_skip_email(self, email_info):
         return os.environ['MY_EMAIL'] in email_info['sender']
 
+    def _execute(self, request, method):
+        """Executes a Gmail API request (or batch request), recording its latency in the metrics."""
+        start = time.perf_counter()
+        error = None
+        try:
+            return request.execute()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            record_gmail_call(method, time.perf_counter() - start, error)
+
+    def _new_batch_request(self, callback):
+        if self.api_endpoint:
+            from googleapiclient.http import BatchHttpRequest
+            batch_uri = self.api_endpoint.rstrip("/") + "/" + BATCH_PATH
+            return BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+        return self.service.new_batch_http_request(callback=callback)
+
+    def _get_messages_batch(self, msg_ids, format="full", metadata_headers=None):
+        """
+        Fetches several messages using Gmail batch requests (up to 100 calls per request).
+        Messages failing with a quota or server error are fetched again with backoff.
+
+        @param msg_ids: List of message ids to fetch
+        @param format: Gmail message format ("full", "metadata", "minimal")
+        @param metadata_headers: Headers to include when format is "metadata"
+        @return: Dictionary mapping each fetched message id to its message resource
+        @raise HttpError: A message could not be fetched (messages deleted since listed are skipped)
+        """
+        messages = {}
+        errors = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+                return
+            messages[request_id] = response
+
+        pending = list(msg_ids)
+        for attempt in range(1, FETCH_ATTEMPTS + 1):
+            errors.clear()
+            for start in range(0, len(pending), BATCH_SIZE):
+                batch = self._new_batch_request(on_response)
+                for msg_id in pending[start:start + BATCH_SIZE]:
+                    kwargs = {"userId": "me", "id": msg_id, "format": format}
+                    if format == "metadata" and metadata_headers:
+                        kwargs["metadataHeaders"] = metadata_headers
+                    batch.add(self.service.users().messages().get(**kwargs), request_id=msg_id)
+                self._execute(batch, "batch.messages.get")
+
+            pending = []
+            for msg_id, error in errors.items():
+                if getattr(getattr(error, "resp", None), "status", None) == 404:
+                    logger.warning(f"Message {msg_id} no longer exists, skipping")
+                elif is_retryable_gmail_error(error) and attempt < FETCH_ATTEMPTS:
+                    pending.append(msg_id)
+                else:
+                    logger.error(f"An error occurred while fetching message {msg_id}: {error}")
+                    raise error
+            if not pending:
+                break
+            delay = random.uniform(0, FETCH_RETRY_DELAY * 2 ** attempt)
+            logger.warning(f"Fetching {len(pending)} messages failed, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+        return messages
+
+    def fetch_thread(self, thread_id, known_ids=()):
+        """
+        Fetches all the messages of a thread in a single call, oldest first.
+
+        @param thread_id: Id of the Gmail thread
+        @param known_ids: Ids of the messages whose body is already known, their body is not extracted
+        @return: List of dictionaries with the id, sender, labels and body (None for known messages) of each message
+        """
+        thread = self._execute(self.service.users().threads().get(
+            userId="me", id=thread_id, format="full"
+        ), "threads.get")
+        messages = []
+        for message in thread.get("messages", []):
+            sender = self._get_headers(message).get("from", "Unknown")
+            body = None
+            if message["id"] not in known_ids:
+                body = self._get_email_body(message.get("payload", {}))
+            messages.append({
+                "id": message["id"], "sender": sender, "labels": message.get("labelIds", []), "body": body
+            })
+        return messages
+
+    def _get_headers(self, message):
+        payload = message.get('payload', {})
+        return {header["name"].lower(): header["value"] for header in payload.get("headers", [])}
+
     def _get_email_info(self, msg_id):
-        message = self.service.users().messages().get(
+        message = self._execute(self.service.users().messages().get(
             userId="me", id=msg_id, format="full"
-        ).execute()
+        ), "messages.get")
+        return self._parse_email_info(message)
 
+    def _parse_email_info(self, message):
         payload = message.get('payload', {})
-        headers = {header["name"].lower(): header["value"] for header in payload.get("headers", [])}
+        headers = self._get_headers(message)
 
         return {
-            "id": msg_id,
+            "id": message["id"],
             "threadId": message.get("threadId"),
             "messageId": headers.get("message-id"),
             "references": headers.get("references", ""),
             "sender": headers.get("from", "Unknown"),
             "subject": headers.get("subject", "No Subject"),
             "body": self._get_email_body(payload),
+            "headers": {name: headers[name] for name in CLASSIFIER_HEADERS if name in headers},
         }
     
     def _get_email_body(self, payload):
         """
         Extract the email body, prioritizing text/plain over text/html.
-        Handles multipart messages, avoids duplicating content, and strips HTML if necessary.
-        """
-        def decode_data(data):
-            """Decode base64-encoded data."""
-            return base64.urlsafe_b64decode(data).decode('utf-8').strip() if data else ""
-
-        def extract_body(parts):
-            """Recursively extract text content from parts."""
-            for part in parts:
-                mime_type = part.get('mimeType', '')
-                data = part['body'].get('data', '')
-                if mime_type == 'text/plain':
-                    return decode_data(data)
-                if mime_type == 'text/html':
-                    html_content = decode_data(data)
-                    return self._extract_main_content_from_html(html_content)
-                if 'parts' in part:
-                    result = extract_body(part['parts'])
-                    if result:
-                        return result
-            return ""
-
-        # Process single or multipart payload
-        if 'parts' in payload:
-            body = extract_body(payload['parts'])
-        else:
-            data = payload['body'].get('data', '')
-            body = decode_data(data)
-            if payload.get('mimeType') == 'text/html':
-                body = self._extract_main_content_from_html(body)
-
-        return self._clean_body_text(body)
-
-    def _extract_main_content_from_html(self, html_content):
-        """
-        Extract main visible content from HTML.
-        """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        for tag in soup(['script', 'style', 'head', 'meta', 'title']):
-            tag.decompose()
-        return soup.get_text(separator='\n', strip=True)
-
-    def _clean_body_text(self, text):
-        """
-        Clean up the email body text by removing extra spaces and newlines.
+        Only the new text is kept (see BodyExtractor): quoted replies, signatures & markup are dropped.
         """
-        return re.sub(r'\s+', ' ', text.replace('\r', '').replace('\n', '')).strip()
+        return self.body_extractor.extract(payload)
     
     def _create_html_email_message(self, recipient, subject, reply_text):
         """
@@ -0,0 +1,217 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+# Thread states recorded in the ledger
+SEEN = "seen"
+CATEGORIZED = "categorized"
+DRAFTED = "drafted"
+SENT = "sent"
+SKIPPED = "skipped"
+REJECTED = "rejected"  # every reply written was rejected by the proofreader
+# A thread in one of these states needs no more work until a new message arrives
+DONE_STATES = (DRAFTED, SENT, SKIPPED, REJECTED)
+
+# States of the replies written to Gmail, keyed by idempotency key
+WRITE_PENDING = "pending"  # attempted, the outcome is unknown (e.g. connection lost)
+WRITE_REJECTED = "rejected"  # rejected by Gmail, nothing was written
+WRITE_DONE = "done"
+WRITE_FAILED = "failed"
+# Seconds a write waits for another process holding the database lock
+BUSY_TIMEOUT_SECONDS = 30
+
+
+class SyncStore:
+    """
+    Local SQLite store keeping the Gmail sync state between runs:
+    the last synced historyId, a ledger with the state of every thread, the
+    idempotency keys of the written replies and the cached text & summaries
+    of the thread messages.
+    """
+    def __init__(self, db_path="gmail_sync.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=BUSY_TIMEOUT_SECONDS)
+        # Shared by the API worker processes: readers don't block the writer in WAL mode
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_ledger ("
+                "thread_id TEXT PRIMARY KEY, "
+                "message_id TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "category TEXT, "
+                "created_at TEXT NOT NULL, "
+                "updated_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_thread_ledger_status "
+                "ON thread_ledger (status, updated_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reply_writes ("
+                "idempotency_key TEXT PRIMARY KEY, "
+                "thread_id TEXT NOT NULL, "
+                "action TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "gmail_id TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "last_error TEXT, "
+                "updated_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS message_text ("
+                "message_id TEXT PRIMARY KEY, "
+                "thread_id TEXT NOT NULL, "
+                "sender TEXT NOT NULL, "
+                "text TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_message_text_thread "
+                "ON message_text (thread_id)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_summary ("
+                "thread_id TEXT PRIMARY KEY, "
+                "message_id TEXT NOT NULL, "
+                "summary TEXT NOT NULL, "
+                "updated_at TEXT NOT NULL)"
+            )
+
+    def get_history_id(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM sync_state WHERE key = 'history_id'"
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_history_id(self, history_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('history_id', ?)",
+                (str(history_id),)
+            )
+
+    def get_thread(self, thread_id):
+        """Returns the ledger entry of the thread as a dictionary, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM thread_ledger WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def is_processed(self, thread_id, message_id):
+        """
+        Checks if the thread needs no more work: the message is its last one and
+        was already drafted, sent, skipped or rejected.
+        """
+        entry = self.get_thread(thread_id)
+        return entry is not None and entry["status"] in DONE_STATES and entry["message_id"] == message_id
+
+    def mark_seen(self, thread_id, message_id):
+        """
+        Records a fetched message. A thread already recorded for this message keeps its
+        state (e.g. categorized or drafted by a run in flight), a new message resets it.
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO thread_ledger "
+                "(thread_id, message_id, status, category, created_at, updated_at) "
+                "VALUES (?, ?, ?, NULL, ?, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET "
+                "message_id = excluded.message_id, "
+                "status = excluded.status, "
+                "category = NULL, "
+                "updated_at = excluded.updated_at "
+                "WHERE message_id != excluded.message_id",
+                (thread_id, message_id, SEEN, now, now)
+            )
+
+    def update_thread(self, thread_id, message_id, status, category=None):
+        """
+        Records the new state of a thread. A new message in the thread resets its category.
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO thread_ledger "
+                "(thread_id, message_id, status, category, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET "
+                "category = CASE WHEN message_id = excluded.message_id "
+                "THEN COALESCE(excluded.category, category) ELSE excluded.category END, "
+                "message_id = excluded.message_id, "
+                "status = excluded.status, "
+                "updated_at = excluded.updated_at",
+                (thread_id, message_id, status, category, now, now)
+            )
+
+    def get_write(self, idempotency_key):
+        """Returns the reply write of the idempotency key as a dictionary, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM reply_writes WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def start_write(self, idempotency_key, thread_id, action):
+        """Records a new attempt to write the reply, its outcome is unknown until it is updated."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO reply_writes (idempotency_key, thread_id, action, status, attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (idempotency_key) DO UPDATE SET "
+                "action = excluded.action, status = excluded.status, "
+                "attempts = attempts + 1, updated_at = excluded.updated_at",
+                (idempotency_key, thread_id, action, WRITE_PENDING, datetime.now().isoformat())
+            )
+
+    def update_write(self, idempotency_key, status, gmail_id=None, error=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE reply_writes SET status = ?, gmail_id = COALESCE(?, gmail_id), "
+                "last_error = ?, updated_at = ? WHERE idempotency_key = ?",
+                (status, gmail_id, error, datetime.now().isoformat(), idempotency_key)
+            )
+
+    def get_message_texts(self, thread_id):
+        """Returns the cached text of the thread messages, as a dictionary of message id -> (sender, text)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id, sender, text FROM message_text WHERE thread_id = ?", (thread_id,)
+            ).fetchall()
+        return {row["message_id"]: (row["sender"], row["text"]) for row in rows}
+
+    def set_message_text(self, message_id, thread_id, sender, text):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO message_text (message_id, thread_id, sender, text) "
+                "VALUES (?, ?, ?, ?)",
+                (message_id, thread_id, sender, text)
+            )
+
+    def get_thread_summary(self, thread_id):
+        """Returns the cached summary of the thread as a tuple of (last summarized message id, summary), or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_id, summary FROM thread_summary WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        return (row["message_id"], row["summary"]) if row else None
+
+    def set_thread_summary(self, thread_id, message_id, summary):
+        """Caches the summary of the thread messages up to message_id (included)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thread_summary (thread_id, message_id, summary, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (thread_id, message_id, summary, datetime.now().isoformat())
+            )
@@ -0,0 +1,142 @@
+import json
+import time
+import sqlite3
+import threading
+
+# Job states
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+# Seconds a write waits for another process holding the database lock
+BUSY_TIMEOUT_SECONDS = 30
+
+
+class WorkQueue:
+    """
+    Durable SQLite work queue: jobs survive restarts, jobs left processing by a crashed
+    process are picked up again and failed jobs are retried with exponential backoff.
+    """
+    def __init__(self, db_path="work_queue.db", max_attempts=5, retry_delay=5.0):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        # Wakes up the consumers waiting for new jobs
+        self._new_job = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=BUSY_TIMEOUT_SECONDS)
+        # Shared by the API worker processes: readers don't block the writer in WAL mode
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "dedup_key TEXT UNIQUE, "
+                "status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "available_at REAL NOT NULL, "
+                "last_error TEXT, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, kind, available_at)"
+            )
+
+    def put(self, kind, payload, dedup_key=None):
+        """
+        Adds a job to the queue.
+
+        @param kind: Job type, consumers only claim the kinds they handle
+        @param payload: JSON serializable job data
+        @param dedup_key: Jobs with an already queued key are ignored (e.g. redelivered notifications)
+        @return: True if the job was added
+        """
+        now = time.time()
+        with self._new_job:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs "
+                    "(kind, payload, dedup_key, status, available_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, json.dumps(payload), dedup_key, PENDING, now, now, now)
+                )
+            self._new_job.notify_all()
+        return cursor.rowcount == 1
+
+    def claim(self, kind, limit=1, timeout=None):
+        """
+        Takes pending jobs of the given kind, waiting up to timeout seconds for one.
+
+        @return: List of (job id, payload) tuples, empty if none became available
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._new_job:
+            while True:
+                now = time.time()
+                # Single statement, so processes sharing the queue file never claim the same job
+                with self._conn:
+                    rows = self._conn.execute(
+                        "UPDATE jobs SET status = ?, updated_at = ? WHERE id IN ("
+                        "SELECT id FROM jobs WHERE status = ? AND kind = ? AND available_at <= ? "
+                        "ORDER BY id LIMIT ?) RETURNING id, payload",
+                        (PROCESSING, now, PENDING, kind, now, limit)
+                    ).fetchall()
+                if rows:
+                    rows = sorted(rows, key=lambda row: row["id"])
+                    return [(row["id"], json.loads(row["payload"])) for row in rows]
+                if deadline is not None and now >= deadline:
+                    return []
+                # Retried jobs become available without notification, check again regularly
+                wait = 1.0 if deadline is None else min(1.0, deadline - now)
+                self._new_job.wait(wait)
+
+    def complete(self, job_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (DONE, time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        """Schedules a retry of the job with exponential backoff, or marks it failed after max_attempts."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            attempts = (row["attempts"] if row else 0) + 1
+            status = FAILED if attempts >= self.max_attempts else PENDING
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, available_at = ?, last_error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (status, attempts, now + self.retry_delay * 2 ** (attempts - 1), str(error), now, job_id)
+            )
+
+    def recover(self, stale_after=600, done_max_age=86400):
+        """
+        Requeues the jobs processing for too long (their process crashed or was killed) and
+        purges old finished jobs (their dedup keys are kept long enough to ignore redelivered
+        notifications).
+
+        @return: Number of requeued jobs
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (PENDING, now, PROCESSING, now - stale_after)
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status = ? AND updated_at < ?", (DONE, now - done_max_age)
+            )
+        return cursor.rowcount
+
+    def counts(self):
+        """Number of jobs in each state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}